@@ -1,29 +1,306 @@
+import datetime
+import gzip
+import hashlib
+import json
+import random
 import requests
+import tempfile
+import threading
 import time
+import os
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
-def fetch_data(url, retries=10):
+env_path = "../.env"
+load_dotenv(env_path)
+
+# Set ALPHA_VANTAGE_BASE_URL to point the pulls somewhere else, e.g. a local stub server
+DEFAULT_BASE_URL = "https://www.alphavantage.co/query"
+# Free keys get 5 calls a minute, set ALPHA_VANTAGE_CALLS_PER_MINUTE to your plan's quota
+DEFAULT_CALLS_PER_MINUTE = 5
+# Response keys Alpha Vantage uses for notices instead of an HTTP error
+NOTICE_KEYS = ["Note", "Information"]
+# Wording of the notices that mean "slow down", waiting a bit and retrying gets through
+# Anything else (daily quota used up, premium-only parameters, invalid key) fails the same way on every retry
+RATE_LIMIT_PHRASES = ["call frequency", "per minute", "per second", "sparingly", "burst"]
+# Where responses are cached, set ALPHA_VANTAGE_CACHE_DIR to "" to turn the cache off
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "alpha_vantage")
+# Daily series are updated after the US close, a new trading day is expected in the API by then
+REFRESH_HOUR_UTC = 22
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket. Holds up to `calls_per_minute` tokens, refilled continuously at
+    `calls_per_minute` per minute, so a burst up to the quota goes out at once and then calls are spaced evenly.
+
+    `pause()` empties the bucket for a while, every thread waiting on it backs off together.
+    Rate limit notices pause it for `throttle_wait` seconds, doubling up to `max_throttle_wait` (see `fetch_data`).
+    """
+    def __init__(self, calls_per_minute:float=DEFAULT_CALLS_PER_MINUTE, throttle_wait:float=60.0, max_throttle_wait:float=300.0):
+        self.throttle_wait = throttle_wait
+        self.max_throttle_wait = max_throttle_wait
+        self.capacity = max(1.0, float(calls_per_minute))
+        self.rate = calls_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        # While paused `updated` is in the future, nothing refills until then
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self):
+        """
+        Blocks until a call is allowed.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds:float):
+        """
+        No calls for `seconds`, and the bucket starts empty afterwards.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+
+rate_limiter = RateLimiter(float(os.getenv("ALPHA_VANTAGE_CALLS_PER_MINUTE", DEFAULT_CALLS_PER_MINUTE)))
+
+
+def write_gzip_json(path:str, value):
     """
-    A safe API call that will retry X times.
+    Writes `value` as gzipped JSON to a temporary file next to `path`, then renames it into place.
     """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Check for HTTP errors
-        data = response.json()
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-        if "Error Message" in data:
-            print(f"API Error: {data['Error Message']}")
-            return None
-        elif "Note" in data:
-            print(f"API Limit or Other Notice: {data['Note']}")
+
+def read_gzip_json(path:str):
+    """
+    Reads a file written by `write_gzip_json`, None if it's missing or unreadable.
+    """
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def last_refreshed(data) -> tuple:
+    """
+    (date, interval) of the newest point in a response: "3. Last Refreshed" for time series,
+    the first item's date for economic indicators (FEDERAL_FUNDS_RATE, CPI). (None, None) if there is neither.
+    """
+    meta = data.get("Meta Data")
+    if isinstance(meta, dict):
+        for key, value in meta.items():
+            if key.endswith("Last Refreshed"):
+                return datetime.date.fromisoformat(str(value)[:10]), "daily"
+    items = data.get("data")
+    if isinstance(items, list) and items and "date" in items[0]:
+        return datetime.date.fromisoformat(items[0]["date"][:10]), data.get("interval")
+    return None, None
+
+
+def next_refresh(date:datetime.date) -> float:
+    """
+    When a daily series last refreshed on `date` should have its next point: the next weekday's refresh hour (UTC).
+    """
+    date += datetime.timedelta(days=1)
+    while date.weekday() >= 5:
+        date += datetime.timedelta(days=1)
+    return datetime.datetime(date.year, date.month, date.day, REFRESH_HOUR_UTC, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def is_rate_limited(message) -> bool:
+    """
+    True if an API notice (see `NOTICE_KEYS`) asks to slow down, e.g. "Our standard API call frequency is 5 calls per minute".
+    A daily quota ("25 requests per day") doesn't count, it won't reset by backing off.
+    """
+    message = str(message).lower()
+    return any(phrase in message for phrase in RATE_LIMIT_PHRASES)
+
+
+class ResponseCache:
+    """
+    Gzipped JSON responses on disk, keyed by the request params (function, symbol, outputsize, ...) minus the API key.
+
+    A daily series is fresh until its next point is expected (see `next_refresh`), so repeat pulls within a trading day
+    are served from disk. Anything else (monthly series, responses without dates) is kept for `ttl` seconds.
+    Fresh entries are also kept at least `min_ttl` seconds, so a late update upstream doesn't mean a request every call.
+
+    Writes go to a temporary file that is renamed into place, readers never see a partial entry.
+    """
+    def __init__(self, directory:str=DEFAULT_CACHE_DIR, ttl:float=24 * 3600, min_ttl:float=3600):
+        self.directory = directory
+        self.ttl = ttl
+        self.min_ttl = min_ttl
+
+    def path(self, params:dict) -> str:
+        params = {key: str(value) for key, value in params.items() if key != "apikey"}
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        name = "_".join(str(params[key]) for key in ["function", "symbol"] if key in params)
+        return os.path.join(self.directory, f"{name}_{digest}.json.gz")
+
+    def expires(self, data, fetched_at:float) -> float:
+        date, interval = last_refreshed(data)
+        if date is not None and interval == "daily":
+            return max(next_refresh(date), fetched_at + self.min_ttl)
+        return fetched_at + self.ttl
+
+    def read(self, params:dict):
+        """
+        The cached entry for `params` ({"fetched_at", "expires_at", "data"}), or None.
+        """
+        return read_gzip_json(self.path(params))
+
+    def get(self, params:dict):
+        """
+        The cached response for `params` if there is one and it hasn't expired, else None.
+        """
+        entry = self.read(params)
+        if entry is None or time.time() >= entry["expires_at"]:
             return None
-        else:
-            return data  # Return the valid data
-
-    except (requests.exceptions.Timeout, requests.exceptions.RequestException, ValueError) as e:
-        if retries > 0:
-            print(f"Error: {e}. Retrying in 1 second...")
-            time.sleep(1)
-            return self.fetch_data(url, retries - 1)
-        else:
-            print("Max retries reached. Failed to retrieve data.")
-            return None
\ No newline at end of file
+        return entry["data"]
+
+    def set(self, params:dict, data):
+        fetched_at = time.time()
+        entry = {"fetched_at": fetched_at, "expires_at": self.expires(data, fetched_at), "data": data}
+        write_gzip_json(self.path(params), entry)
+
+
+class AlphaVantageClient:
+    """
+    A pooled HTTP client for the Alpha Vantage API, shared by `Stock`, `FederalFundRate` and `ConsumerPriceIndex`.
+
+    One `requests.Session` keeps connections alive between calls, so a portfolio pull does the TCP/TLS handshake
+    once per connection instead of once per request. At most `max_connections` connections are open per host,
+    threads beyond that wait for a free one.
+
+    Failed requests (timeouts, connection errors, HTTP 429/5xx, bad JSON) are retried in a loop with jittered
+    exponential backoff: a random wait between half and all of `backoff * 2**attempt`, capped at `max_backoff`.
+    Rate limit notices back off through the rate limiter instead (see `fetch`).
+
+    With a `cache`, `get` serves responses from disk while they're fresh (see `ResponseCache`).
+    """
+    def __init__(self, base_url:str|None=None, api_key:str|None=None, limiter:RateLimiter|None=None, timeout:tuple=(5, 30), retries:int=10, backoff:float=1.0, max_backoff:float=60.0, max_connections:int=10, cache:ResponseCache|None=None):
+        self.base_url = base_url or os.getenv("ALPHA_VANTAGE_BASE_URL", DEFAULT_BASE_URL)
+        self.api_key = api_key or os.getenv("ALPHA_VANTAGE_API_KEY")
+        self.limiter = limiter or rate_limiter
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, **params) -> str:
+        """
+        The query URL for `params`, e.g. `url(function="TIME_SERIES_DAILY", symbol="IBM")`. Adds the API key.
+        """
+        return requests.Request("GET", self.base_url, params={**params, "apikey": self.api_key}).prepare().url
+
+    def get(self, refresh:bool=False, **params):
+        """
+        Calls the API with `params` (see `url`). Returns the JSON response, or None if it failed.
+        A fresh cached response is returned without any network I/O, unless `refresh`.
+        """
+        if self.cache is not None and not refresh:
+            data = self.cache.get(params)
+            if data is not None:
+                return data
+        data = self.fetch(self.url(**params))
+        if data is not None and self.cache is not None:
+            self.cache.set(params, data)
+        return data
+
+    def retry_wait(self, attempt:int) -> float:
+        wait = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return random.uniform(wait / 2, wait)
+
+    def fetch(self, url, retries:int|None=None, limiter:RateLimiter|None=None):
+        """
+        A safe API call that will retry X times (`retries`, default the client's).
+
+        Every attempt waits for a token from `limiter` (the client's by default), so any number of threads can
+        call this without going over the quota. A rate limit notice (see `is_rate_limited`) pauses the limiter,
+        for longer each time it happens again, and retries. Other notices and HTTP 4xx errors aren't retried.
+        """
+        retries = self.retries if retries is None else retries
+        limiter = limiter or self.limiter
+        throttle_wait = limiter.throttle_wait
+        for attempt in range(retries + 1):
+            limiter.acquire()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()  # Check for HTTP errors
+                data = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                if status is not None and 400 <= status < 500 and status != 429:
+                    print(f"API Error: {e}")
+                    return None
+                if attempt < retries:
+                    wait = self.retry_wait(attempt)
+                    print(f"Error: {e}. Retrying in {wait:.1f} seconds...")
+                    time.sleep(wait)
+                    continue
+                print("Max retries reached. Failed to retrieve data.")
+                return None
+
+            if "Error Message" in data:
+                print(f"API Error: {data['Error Message']}")
+                return None
+            notice = next((key for key in NOTICE_KEYS if key in data), None)
+            if notice is None:
+                return data  # Return the valid data
+            if not is_rate_limited(data[notice]):
+                print(f"API Notice: {data[notice]}")
+                return None
+            print(f"API Limit: {data[notice]}")
+            if attempt < retries:
+                print(f"Backing off for {throttle_wait} seconds...")
+                limiter.pause(throttle_wait)
+                throttle_wait = min(throttle_wait * 2, limiter.max_throttle_wait)
+        print("Max retries reached. Failed to retrieve data.")
+        return None
+
+    def close(self):
+        self.session.close()
+
+
+cache_dir = os.getenv("ALPHA_VANTAGE_CACHE_DIR", DEFAULT_CACHE_DIR)
+client = AlphaVantageClient(cache=ResponseCache(cache_dir) if cache_dir else None)
+
+
+def fetch_data(url, retries=10, limiter:RateLimiter|None=None):
+    """
+    A safe API call that will retry X times. Goes through the shared `client`, see `AlphaVantageClient.fetch`.
+    """
+    return client.fetch(url, retries=retries, limiter=limiter)
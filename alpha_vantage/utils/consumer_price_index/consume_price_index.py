@@ -2,8 +2,9 @@ import requests
 import time
 import datetime
 import os
-from dotenv import load_dotenv
-from utils.api import fetch_data
+import numpy as np
+from utils.api import AlphaVantageClient, client as default_client
+from utils.series import Series, VALUE_COLUMNS
 
 """
 
@@ -29,10 +30,6 @@ Data from API looks like:
 }
 """
 
-env_path = "../.env"
-load_dotenv(env_path)
-api_key = os.getenv("ALPHA_VANTAGE_API_KEY")
-base_url = "https://www.alphavantage.co/query"
 
 class ConsumerPriceIndex:
     """
@@ -41,11 +38,31 @@ class ConsumerPriceIndex:
     You can pull data from the API fresh with get().
 
     You can set information you've pulled elsewhere with set_data().
+
+    Values are stored columnar in `self.series` (see `Series`), `self.data` is its list of dicts view.
+    That view is read-only, it's rebuilt on every access so changes to the list are lost. Assign `self.data` or call set_data() instead.
     """
 
-    def __init__(self):
-        self.data = []
+    def __init__(self, client:AlphaVantageClient|None=None):
+        self.series:Series = Series.empty(VALUE_COLUMNS)
         self.name = "consumer_price_index"
+        self.client = client if client is not None else default_client
+
+    @property
+    def data(self) -> list:
+        return self.series.to_records()
+
+    @data.setter
+    def data(self, data:list):
+        self.set_data(data)
+
+    @property
+    def min_date(self) -> datetime.datetime|None:
+        return self.series.min_date
+
+    @property
+    def max_date(self) -> datetime.datetime|None:
+        return self.series.max_date
 
     def get(self):
         """
@@ -64,14 +81,15 @@ class ConsumerPriceIndex:
             }
         ]
         """
-        self.data=[]
-        api_url=f"{base_url}?function=CPI&interval=daily&apikey={api_key}"
-        response_data = fetch_data(api_url)
+        self.series = Series.empty(VALUE_COLUMNS)
+        response_data = self.client.get(function="CPI", interval="daily")
         if response_data is None:
             print(f"Failed to pull data for {self.name}")
             return None
         print(f"Parsing data for {self.name}...")
         daily_data = response_data['data']
+        dates = []
+        values = []
         interval = 0
         total_intervals = len(daily_data)
         for item in daily_data:
@@ -79,13 +97,9 @@ class ConsumerPriceIndex:
             print(f"Processing {self.name} - {interval}/{total_intervals}", end="\r")
             date_formatted = datetime.datetime.strptime(item['date'], "%Y-%m-%d")
             value = item['value']
-            cleaned_data = {
-                "year":date_formatted.year,
-                "month":date_formatted.month,
-                "day": date_formatted.day,
-                "value":float(value)
-            }
-            self.data.append(cleaned_data)
+            dates.append(date_formatted.date())
+            values.append(float(value))
+        self.series = Series(np.array(dates, dtype="datetime64[D]"), {"value": np.array(values, dtype=np.float64)})
         print("Completed consumer price index pull.")
 
     def set_data(self,data):
@@ -103,4 +117,4 @@ class ConsumerPriceIndex:
             }
         ]
         """
-        self.data = data
\ No newline at end of file
+        self.series = data if isinstance(data, Series) else Series.from_records(data, VALUE_COLUMNS)
\ No newline at end of file
@@ -18,8 +18,8 @@ from typing import Dict, Literal, TypedDict, Any, List
 from utils.user_input import get_boolean_from_user
 import traceback
 
-class AssetData(TypedDict):
-    data: List[Dict[str, Any]]  
+class AssetData(TypedDict, total=False):
+    data: List[Dict[str, Any]]  # Only read for items without a columnar `series`
     keys: List[str]             
     item: Any
 
@@ -32,6 +32,8 @@ def prepare_data(stocks:list[Stock],metadata:MetadataObject={}):
 
     Metadata needs to look like this:
     {"key_of_asset":{"data":data, "keys":[...,"key_in_data"], "item":Item}}
+    "data" can be left out when the item has a `series` (Stock, FederalFundRate, ConsumerPriceIndex), rows are then
+    read from the series for the shared date range only.
 
     This is into ensure that the data can be parsed for adding to the dataset.
 
@@ -52,7 +54,7 @@ def prepare_data(stocks:list[Stock],metadata:MetadataObject={}):
             true_max = i.max_date
         if i.min_date > true_min:
             true_min = i.min_date
-        total_key_map[i.name]={"max":i.max_date, "min":i.min_date, "data":i.data, "item":i}
+        total_key_map[i.name]={"max":i.max_date, "min":i.min_date, "size":len(i.series), "item":i}
     # Repeat for the metadata hashmap
     for key in list(metadata.keys()):
         record = metadata[key]['item']
@@ -63,7 +65,9 @@ def prepare_data(stocks:list[Stock],metadata:MetadataObject={}):
             true_max = record.max_date
         if record.min_date > true_min:
             true_min = record.min_date
-        total_key_map[key]={"max":record.max_date, "min":record.min_date, "data":record.data, "item":record}
+        # Row counts come from the columnar series, the `.data` rows are only built for the shared range below
+        size = len(record.series) if hasattr(record, "series") else len(metadata[key]['data'])
+        total_key_map[key]={"max":record.max_date, "min":record.min_date, "size":size, "item":record}
     
     # Mine for violators of this, ask if the user would like to parse them and proceed.
     violators = []
@@ -109,7 +113,7 @@ TOTAL_DAYS: {(true_max-true_min).days}
 {key}
 MIN: {record['min']}
 MAX: {record['max']}
-RECORDS_DROPPED = {abs((true_max-true_min).days-len(record['data']))}
+RECORDS_DROPPED = {abs((true_max-true_min).days-record['size'])}
 """)        
         print("""
               
@@ -126,10 +130,16 @@ Would you like to trim these datasets to be equal? (y|n)""")
             cleaned_record = {"max":true_max, "min":true_min, "item":record['item']}
             # Dates are used to hashmap for cross item stiching
             cleaned_row_data = {}
-            for i in record['data']:
-                parsed_date = datetime.datetime.strptime(f"{i['year']}-{i['month']}-{i['day']}", "%Y-%m-%d")
-                if parsed_date >= true_min and parsed_date <= true_max:
-                    cleaned_row_data[f"{i['year']}-{i['month']}-{i['day']}"]=i
+            if hasattr(record['item'], "series"):
+                # Columnar items slice the shared range out of their date index instead of scanning every row
+                rows = record['item'].series.between(true_min, true_max).to_records()
+            else:
+                rows = [
+                    i for i in metadata[key]['data']
+                    if true_min <= datetime.datetime.strptime(f"{i['year']}-{i['month']}-{i['day']}", "%Y-%m-%d") <= true_max
+                ]
+            for i in rows:
+                cleaned_row_data[f"{i['year']}-{i['month']}-{i['day']}"]=i
             cleaned_record['data']=cleaned_row_data
             cleaned_key_map[key]=cleaned_record
 
@@ -0,0 +1,29 @@
+import os
+from utils.api import DEFAULT_CACHE_DIR, read_gzip_json, write_gzip_json
+
+# Where synced price histories are kept, see `Stock.sync`
+DEFAULT_HISTORY_DIR = os.path.join(DEFAULT_CACHE_DIR, "history")
+
+
+class HistoryStore:
+    """
+    Persisted price histories, one gzipped JSON list of rows (the `Stock.data` shape) per ticker.
+    Writes are atomic, an interrupted save leaves the previous history in place.
+    """
+    def __init__(self, directory:str=DEFAULT_HISTORY_DIR):
+        self.directory = directory
+
+    def path(self, ticker:str) -> str:
+        return os.path.join(self.directory, f"{ticker}.json.gz")
+
+    def load(self, ticker:str) -> list:
+        """
+        The stored rows for `ticker`, empty if there are none.
+        """
+        return read_gzip_json(self.path(ticker)) or []
+
+    def save(self, ticker:str, data:list):
+        write_gzip_json(self.path(ticker), data)
+
+
+history_store = HistoryStore(os.getenv("ALPHA_VANTAGE_HISTORY_DIR", DEFAULT_HISTORY_DIR))
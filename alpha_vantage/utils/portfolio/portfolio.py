@@ -2,9 +2,10 @@
 
 from utils.stock.stock import Stock
 from utils.federal_fund_rate.federal_fund_rate import FederalFundRate
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Literal, TypedDict, Any
 from utils.data_linting import prepare_data
+from utils.api import rate_limiter
 
 # Define the allowed value types
 allowed_key_types = Literal["float", "int", "date", "string", "category", "boolean"]
@@ -61,22 +62,38 @@ Portfolios can contain:
         self.stocks=stocks
         self.stocknames=stocknames
 
-    def initialize(self):
+    def initialize(self, max_workers:int|None=None, sync:bool=False):
         """
         Pulls the data for each stock from the API. Also does Federal Fund Rate if applicable.
+
+        With `sync` stocks only pull their latest days into their stored history (see `Stock.sync`).
+
+        Pulls run in parallel on `max_workers` threads (default: as many as the rate limiter's per minute quota).
+        The shared rate limiter in `utils.api` keeps them under the quota and backs off on throttle responses.
         """
         print("Initalizing portfolio data pull...")
-        interval = 0
-        max_intervals = len(self.stocks)
-        for stock in self.stocks:
-            interval+=1
-            print(f"Pulling stock {interval}/{max_intervals} ({stock.ticker})...", end="\r")
-            time.sleep(1)
-            stock.get()
+        pulls = list(self.stocks)
         if self.federal_fund_rate is not None:
-            print(f"Pulling federal fund rate...")
-            time.sleep(1)
-            self.federal_fund_rate.get()
+            pulls.append(self.federal_fund_rate)
+        if not pulls:
+            print("\nInitalization complete for portfolio.")
+            return
+        if max_workers is None:
+            max_workers = int(rate_limiter.capacity)
+        max_workers = max(1, min(max_workers, len(pulls)))
+        interval = 0
+        max_intervals = len(pulls)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(item.sync if sync and isinstance(item, Stock) else item.get): item for item in pulls}
+            for future in as_completed(futures):
+                item = futures[future]
+                interval+=1
+                try:
+                    future.result()
+                    print(f"Pulled {interval}/{max_intervals} ({item.name})")
+                except Exception as e:
+                    print(f"ERROR - failed pulling {item.name}")
+                    print(e)
         print("\nInitalization complete for portfolio.")
 
     def generate(self):
@@ -88,7 +105,7 @@ Portfolios can contain:
         """
         print("Starting generation...")
         if self.federal_fund_rate:
-            prepared_data = prepare_data(self.stocks, {"federal_fund_rate":{"data":self.federal_fund_rate.data, "keys":["value"], "item":self.federal_fund_rate}})
+            prepared_data = prepare_data(self.stocks, {"federal_fund_rate":{"keys":["value"], "item":self.federal_fund_rate}})
             self.model_data = prepared_data['data']
             self.model_keys = prepared_data['model_keys']
         else:
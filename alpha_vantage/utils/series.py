@@ -0,0 +1,109 @@
+import datetime
+import numpy as np
+from typing import Dict, Any, List
+
+# Column layouts of the series the API returns
+STOCK_COLUMNS = {"open": np.float64, "high": np.float64, "low": np.float64, "close": np.float64, "volume": np.int64}
+VALUE_COLUMNS = {"value": np.float64}
+
+
+def to_datetime(date:np.datetime64) -> datetime.datetime:
+    return date.astype("datetime64[us]").item()
+
+
+def to_datetime64(date) -> np.datetime64:
+    """
+    A day from a `datetime.date`/`datetime.datetime`, an ISO string or a `np.datetime64`.
+    """
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    return np.datetime64(date, "D")
+
+
+class Series:
+    """
+    A daily series stored as a struct of arrays: a sorted, unique `datetime64[D]` index (`dates`) and one numpy
+    array per column (`columns`, float64 or int64). A row costs 8 bytes per column plus 8 for the date.
+
+    `min_date`/`max_date` are the ends of the index, `between()` slices a date range without copying and
+    `to_records()` gives the old list of {year, month, day, ...columns} dicts, newest first like the API.
+    """
+    def __init__(self, dates:np.ndarray, columns:Dict[str, np.ndarray]):
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        columns = {key: np.asarray(values) for key, values in columns.items()}
+        for key, values in columns.items():
+            if len(values) != len(dates):
+                raise ValueError(f"Column {key} has {len(values)} values for {len(dates)} dates")
+        if len(dates) > 1 and not (dates[1:] > dates[:-1]).all():
+            # Sort by date, the last row wins for a repeated date
+            order = np.argsort(dates, kind="stable")
+            dates = dates[order]
+            keep = np.append(dates[1:] != dates[:-1], True)
+            order = order[keep]
+            dates = dates[keep]
+            columns = {key: values[order] for key, values in columns.items()}
+        self.dates = dates
+        self.columns = columns
+
+    @classmethod
+    def empty(cls, schema:Dict[str, Any]) -> "Series":
+        return cls(np.array([], dtype="datetime64[D]"), {key: np.array([], dtype=dtype) for key, dtype in schema.items()})
+
+    @classmethod
+    def from_records(cls, records:List[Dict[str, Any]], schema:Dict[str, Any]) -> "Series":
+        """
+        Builds a series from rows shaped like `to_records()` (year/month/day plus the `schema` columns).
+        """
+        dates = np.array([f"{row['year']:04d}-{row['month']:02d}-{row['day']:02d}" for row in records], dtype="datetime64[D]")
+        return cls(dates, {key: np.array([row[key] for row in records], dtype=dtype) for key, dtype in schema.items()})
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, key:str) -> np.ndarray:
+        return self.columns[key]
+
+    @property
+    def min_date(self) -> datetime.datetime|None:
+        return to_datetime(self.dates[0]) if len(self.dates) else None
+
+    @property
+    def max_date(self) -> datetime.datetime|None:
+        return to_datetime(self.dates[-1]) if len(self.dates) else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.dates.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def between(self, start=None, end=None) -> "Series":
+        """
+        Rows dated from `start` to `end`, both included. Either end can be None for open ended.
+        The result shares memory with this series.
+        """
+        lo = np.searchsorted(self.dates, to_datetime64(start), side="left") if start is not None else 0
+        hi = np.searchsorted(self.dates, to_datetime64(end), side="right") if end is not None else len(self.dates)
+        return Series(self.dates[lo:hi], {key: values[lo:hi] for key, values in self.columns.items()})
+
+    def merge(self, other:"Series") -> "Series":
+        """
+        The rows of both series, `other`'s winning on the same date.
+        """
+        return Series(
+            np.concatenate([self.dates, other.dates]),
+            {key: np.concatenate([values, other.columns[key]]) for key, values in self.columns.items()},
+        )
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """
+        The rows as {year, month, day, ...columns} dicts with plain Python values, newest first.
+        """
+        dates = self.dates[::-1]
+        months = dates.astype("datetime64[M]")
+        years = (dates.astype("datetime64[Y]").astype(np.int64) + 1970).tolist()
+        month_numbers = (months.astype(np.int64) % 12 + 1).tolist()
+        days = ((dates - months).astype(np.int64) + 1).tolist()
+        columns = {key: values[::-1].tolist() for key, values in self.columns.items()}
+        return [
+            {"year": years[i], "month": month_numbers[i], "day": days[i], **{key: column[i] for key, column in columns.items()}}
+            for i in range(len(dates))
+        ]
@@ -24,14 +24,12 @@ import requests
 import time
 import datetime
 import os
-from dotenv import load_dotenv
+import numpy as np
 
-from utils.api import fetch_data
+from utils.api import AlphaVantageClient, client as default_client
+from utils.history import HistoryStore, history_store
+from utils.series import Series, STOCK_COLUMNS
 
-env_path = "../.env"
-load_dotenv(env_path)
-api_key = os.getenv("ALPHA_VANTAGE_API_KEY")
-base_url = "https://www.alphavantage.co/query"
 
 
 
@@ -40,10 +38,13 @@ class Stock:
 
     Has a min_date/max_date property for its price range.
 
-    You can pull data from the API fresh with get().
+    You can pull data from the API fresh with get(), or bring a stored history up to date with sync().
 
     You can set information you've pulled elswhere with set_data().
 
+    Prices are stored columnar in `self.series` (see `Series`), `self.data` is its list of dicts view.
+    That view is read-only, it's rebuilt on every access so changes to the list are lost. Assign `self.data` or call set_data() instead.
+
     The data shape is:
     [
         ...
@@ -60,19 +61,35 @@ class Stock:
     ]
     
     """
-    def __init__(self,name,ticker):
+    def __init__(self,name,ticker,client:AlphaVantageClient|None=None):
         self.name = name
         self.ticker = ticker
-        self.data = []
-        self.max_date:datetime.datetime|None = None
-        self.min_date:datetime.datetime|None = None
+        # Stocks share one pooled client unless given their own
+        self.client = client if client is not None else default_client
+        self.series:Series = Series.empty(STOCK_COLUMNS)
+
+    @property
+    def data(self) -> list:
+        return self.series.to_records()
+
+    @data.setter
+    def data(self, data:list):
+        self.set_data(data)
 
+    @property
+    def min_date(self) -> datetime.datetime|None:
+        return self.series.min_date
+
+    @property
+    def max_date(self) -> datetime.datetime|None:
+        return self.series.max_date
             
-    def get(self):
+    def get(self, outputsize:str="full"):
         """
         Returns the full data pulled from the API. Sets to `self.data`
 
         Resets `self.data` if there was information set there.
+        `outputsize="compact"` pulls only the latest 100 days.
 
         Data Shape:
         [
@@ -86,12 +103,9 @@ class Stock:
             }
         ]
         """
-        self.data = []
+        self.series = Series.empty(STOCK_COLUMNS)
         print(f"Pulling for {self.ticker}...")
-        # Build URL
-        api_url = f"{base_url}?function=TIME_SERIES_DAILY&symbol={self.ticker}&outputsize=full&apikey={api_key}"
-        gathered = False
-        response_data = fetch_data(api_url)
+        response_data = self.client.get(function="TIME_SERIES_DAILY", symbol=self.ticker, outputsize=outputsize)
         if response_data is None:
             print(f"Failed to pull data for {self.ticker}")
             return None
@@ -99,6 +113,8 @@ class Stock:
         # Parse data
         daily_data = response_data['Time Series (Daily)']
         stringdates = list(daily_data.keys())
+        dates = []
+        rows = []
         interval = 0
         total_intervals = len(stringdates)
         for stringdate in stringdates:
@@ -108,39 +124,62 @@ class Stock:
                 # Parse important info
                 date_formatted = datetime.datetime.strptime(stringdate, "%Y-%m-%d")
                 date_info = daily_data[stringdate]
-                cleaned_data = {
-                    "year":date_formatted.year,
-                    "month":date_formatted.month,
-                    "day":date_formatted.day,
-                    "open":float(date_info['1. open']),
-                    "high":float(date_info['2. high']),
-                    "low":float(date_info['3. low']),
-                    "close":float(date_info['4. close']),
-                    "volume":int(date_info['5. volume'])
-                }
-                # Manage stock min/max
-                if self.max_date is None or self.min_date is None:
-                    self.max_date = date_formatted
-                    self.min_date = date_formatted
-                if date_formatted > self.max_date:
-                    self.max_date = date_formatted
-                if date_formatted < self.min_date:
-                    self.min_date = date_formatted
-                # Add to class
-                self.data.append(cleaned_data)
+                cleaned_data = (
+                    float(date_info['1. open']),
+                    float(date_info['2. high']),
+                    float(date_info['3. low']),
+                    float(date_info['4. close']),
+                    int(date_info['5. volume'])
+                )
+                dates.append(date_formatted.date())
+                rows.append(cleaned_data)
             except Exception as e:
                 print(f"ERROR - failed parsing data {interval}/{total_intervals}")
                 print(e)
+        # Columns in one go, the index keeps min/max dates
+        columns = list(zip(*rows)) or [[] for _ in STOCK_COLUMNS]
+        self.series = Series(np.array(dates, dtype="datetime64[D]"), {key: np.array(column, dtype=dtype) for (key, dtype), column in zip(STOCK_COLUMNS.items(), columns)})
         print(f"\nData pull for {self.ticker} complete.")
     
+    def sync(self, store:HistoryStore|None=None):
+        """
+        Brings the stored history for this ticker up to date and sets it to `self.data`.
+
+        Only the latest 100 days are pulled (`outputsize="compact"`) and merged into the stored rows, newer values
+        winning on the same date. The full history is pulled instead when nothing is stored yet, or when the compact
+        pull doesn't reach back to the newest stored day (a gap). The result is saved back to `store`.
+        """
+        store = store if store is not None else history_store
+        history = Series.from_records(store.load(self.ticker), STOCK_COLUMNS)
+        if not len(history):
+            print(f"No stored history for {self.ticker}, pulling full history...")
+            self.get()
+        else:
+            self.get(outputsize="compact")
+            if not len(self.series):
+                print(f"Keeping stored history for {self.ticker}")
+                self.series = history
+                return None
+            if self.min_date > history.max_date:
+                print(f"Gap between stored history and latest pull for {self.ticker}, pulling full history...")
+                self.get()
+            else:
+                self.series = history.merge(self.series)
+        if len(self.series):
+            store.save(self.ticker, self.data)
+
     def set_data(self, data:list):
         """
         A function to set data, in the event that its been loaded elsewhere.
+        Takes a `Series` or a list of rows.
 
         Expected data shape:
         [
         ...
             {
+                year:integer,
+                month:integer,
+                day:integer,
                 open:float, 
                 high:float, 
                 low:float,
@@ -149,5 +188,5 @@ class Stock:
             }
         ]
         """
-        self.data=data
+        self.series = data if isinstance(data, Series) else Series.from_records(data, STOCK_COLUMNS)
     
\ No newline at end of file
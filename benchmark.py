@@ -0,0 +1,62 @@
+from tbt.model.model import DataTransformerModel
+from tbt.config.config import ModelConfig
+import time
+import torch
+
+# Portfolio shaped config: 5 price fields for 6 tickers plus the federal funds rate
+config = ModelConfig()
+for ticker in ["AAPL", "MSFT", "GOOG", "AMZN", "META", "NVDA"]:
+    for field in ["open", "high", "low", "close"]:
+        config.float(f"{ticker}_{field}", 500)
+    config.int(f"{ticker}_volume", 1e8)
+config.float("fed_rate", 10)
+
+model = DataTransformerModel(
+    config=config,
+    d_model=64,
+    nhead=8,
+    num_encoder_layers=3,
+    num_decoder_layers=3,
+    dim_feedforward=64,
+    dropout=.1,
+    max_len=5000,
+    output_scale=1.0
+)
+
+
+def timed(fn, runs=50):
+    fn()
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def train_step(source, target):
+    model.zero_grad()
+    output = model(source, target)
+    sum(tensor.sum() for tensor in output.values()).backward()
+
+
+# Embedding + heads alone, then the whole model, for a single generation step and a training batch
+step_source = {key: torch.randn(1, 64, layer.embedding_dim) for key, layer in config.layers.items()}
+step_target = {key: torch.randn(1, 1, layer.embedding_dim) for key, layer in config.layers.items()}
+batch_source = {key: torch.randn(32, 64, layer.embedding_dim) for key, layer in config.layers.items()}
+batch_target = {key: torch.randn(32, 64, layer.embedding_dim) for key, layer in config.layers.items()}
+hidden = torch.randn(1, 1, 64)
+
+print(f"{len(config.layers)} keys, times in ms")
+print(f"{'':<32}{'per key':>10}{'fused':>10}")
+for name, fn, grad in [
+    ("embed + heads, 1 row", lambda: (model.embed(step_target), model.project_output(hidden)), False),
+    ("forward, 64 src / 1 tgt row", lambda: model(step_source, step_target), False),
+    ("forward, 32 x 64 rows", lambda: model(batch_source, batch_target), False),
+    ("train step, 32 x 64 rows", lambda: train_step(batch_source, batch_target), True),
+]:
+    timings = []
+    for fused in [False, True]:
+        model.fused = fused
+        model.train(grad)
+        with torch.set_grad_enabled(grad):
+            timings.append(timed(fn, runs=10 if grad else 50))
+    print(f"{name:<32}{timings[0]:>10.2f}{timings[1]:>10.2f}")
@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+import tempfile
+import torch
+from typing import Dict, Any, Optional, Tuple
+from tbt.config.config import ModelConfig
+from tbt.model.model import DataTransformerModel
+
+CHECKPOINT_FORMAT = 1
+
+
+def snapshot(model: DataTransformerModel, optimizer=None, extra: Dict[str, Any] = {}) -> Dict[str, Any]:
+    """
+    Everything needed to rebuild `model` (and resume its optimizer) as a plain dict.
+    Tensors are copied to the CPU, so training can keep updating the originals while the snapshot is written.
+    """
+    return {
+        "format": CHECKPOINT_FORMAT,
+        "config": model.config.to_dict(),
+        "hparams": dict(model.hparams),
+        "model": {key: tensor.detach().to("cpu", copy=True) for key, tensor in model.state_dict().items()},
+        "optimizer": _cpu_copy(optimizer.state_dict()) if optimizer is not None else None,
+        **extra,
+    }
+
+
+def _cpu_copy(value):
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: _cpu_copy(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_cpu_copy(item) for item in value)
+    return value
+
+
+def write_checkpoint(checkpoint: Dict[str, Any], path: str):
+    """
+    Writes a snapshot to `path` atomically, readers never see a partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            torch.save(checkpoint, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_checkpoint(path: str, model: DataTransformerModel, optimizer=None, extra: Dict[str, Any] = {}):
+    """ Saves the model, its `ModelConfig` and optionally the optimizer state to `path`. """
+    write_checkpoint(snapshot(model, optimizer, extra), path)
+
+
+def read_checkpoint(path: str) -> Dict[str, Any]:
+    """
+    Memory-maps a checkpoint. Tensors are views of the file, pages are only read when first touched.
+    """
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    if checkpoint.get("format") != CHECKPOINT_FORMAT:
+        raise ValueError(f"Unsupported checkpoint format {checkpoint.get('format')} in {path}")
+    return checkpoint
+
+
+def load_checkpoint(path: str) -> Tuple[DataTransformerModel, ModelConfig, Dict[str, Any]]:
+    """
+    Rebuilds a model from a checkpoint written by `save_checkpoint`.
+
+    Translators, vocabularies and normalizers come back through the saved `ModelConfig`.
+    On CPU the weights are assigned straight from the memory-mapped file without copying.
+    Returns (model, config, checkpoint), `checkpoint["optimizer"]` holds the optimizer state if it was saved.
+    """
+    checkpoint = read_checkpoint(path)
+    config = ModelConfig.from_dict(checkpoint["config"])
+    model = DataTransformerModel(config, **checkpoint["hparams"])
+    # Nothing references the fresh parameters yet, so they can be swapped for the mapped tensors
+    load_weights(model, checkpoint, assign=model.device.type == "cpu")
+    return model, config, checkpoint
+
+
+def load_weights(model: DataTransformerModel, checkpoint: Dict[str, Any], assign: bool = False):
+    """
+    Loads checkpoint weights into an existing model with a matching config.
+
+    By default values are copied into the existing parameters, which keeps any optimizer pointing at them valid.
+    `assign` replaces the parameters with the checkpoint tensors instead (zero-copy from a memory-mapped file).
+    """
+    # Rebuilt first, so fields added to the spec since the checkpoint was written take their defaults
+    if ModelConfig.from_dict(checkpoint["config"]).to_dict() != model.config.to_dict():
+        raise ValueError("Checkpoint was saved with a different ModelConfig.")
+    model.load_state_dict(checkpoint["model"], assign=assign)
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoints on a background thread.
+
+    `save()` takes the snapshot on the calling thread (a quick copy of the weights) and returns,
+    the serialization and disk write happen off the training thread. Call `wait()` to flush.
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is not None:
+                    checkpoint, path = item
+                    write_checkpoint(checkpoint, path)
+            except BaseException as e:
+                self.error = e
+                print(f"Failed writing checkpoint: {e}")
+            finally:
+                self.queue.task_done()
+            if item is None:
+                return
+
+    def save(self, path: str, model: DataTransformerModel, optimizer=None, extra: Dict[str, Any] = {}):
+        self.queue.put((snapshot(model, optimizer, extra), path))
+
+    def wait(self):
+        """ Blocks until every queued checkpoint is on disk. """
+        self.queue.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
+        self.wait()
+        self.queue.put(None)
+        self.thread.join()
@@ -1,13 +1,20 @@
 from tbt.trainer.trainer import Trainer
 from tbt.model.model import DataTransformerModel
+from tbt.model.generation import GenerationEngine
+from tbt.config.config import ModelConfig
+from tbt.checkpoint.checkpoint import read_checkpoint
 import torch.nn.functional as F
 import torch
 import sys
+import os
+
+CHECKPOINT_DIR = "checkpoints"
 
 class CLI:
     def __init__(self, model:DataTransformerModel,trainer:Trainer):
         self.model = model
         self.trainer = trainer
+        self.engine = GenerationEngine(model)
     
     def run(self,user_input):
         cont = True
@@ -26,6 +33,14 @@ class CLI:
                 count = int(input("# Number of records: "))
                 temp = float(input("# Temperature: "))
                 self.generate(count, temp)
+            elif user_input=="export":
+                name = input("# Checkpoint name: ")
+                self.export(name)
+            elif user_input=="load":
+                path = input("# Dataset path: ")
+                self.load_data(path)
+            elif user_input.startswith("load-"):
+                self.load_checkpoint(user_input[len("load-"):])
             else:
                 a=0
                 # print(user_input)
@@ -45,34 +60,77 @@ class CLI:
         # Get the last index source/target from Trainer data and use that
         source = self.trainer.source[len(self.trainer.source)-1]
         target = self.trainer.target[len(self.trainer.target)-1]
-        output = self.generate_sequence(self.model,target,source, number)
+        output = self.generate_sequence(self.model,target,source, number, temperature)
         view = input("# Would you like these printed? (y/n): ")
         if view=="y":
             for i in output:
                 print(i)
         return output
-    def generate_sequence(self, model, initial_target, source, N, temperature=1.0):
-        current_output = source
-        previous_output = initial_target
-        generated_sequence = []
-        self.model.eval()
-        for _ in range(N):
-            # Step 1: Generate output using the current target
-            # if isinstance(target,dict):
-            #     target = [target]
-            output = model([current_output], [previous_output]) 
-            # Step 2: Decode the output to get predictions
-            predictions = model.decode_output(output)
-            original_prediction = predictions['original']
-            # Save the predictions to the generated sequence list
-            generated_sequence.append(original_prediction)
-            # Step 3: Update the target with the new predictions
-            # Here, we need to format the predictions to be used as the next target
-            current_output = previous_output
-            previous_output = {key: original_prediction[key] for key in original_prediction.keys()}
-        return generated_sequence
+    def generate_sequence(self, model, initial_target, source, N, temperature=0.0):
+        """
+        Generates `N` records after `initial_target`. The source is encoded once and the
+        decoder is extended one record at a time (see `GenerationEngine`).
+
+        A `temperature` above 0 samples each record instead of taking the most likely one.
+        """
+        if model is not self.engine.model:
+            self.engine = GenerationEngine(model)
+        if temperature > 0:
+            return self.engine.sample(source, initial_target, N, trajectories=1, temperature=temperature)[0]
+        return self.engine.generate(source, initial_target, N)
 
 
+    def checkpoint_path(self, name):
+        return os.path.join(CHECKPOINT_DIR, f"{name}.pt")
+
+    def export(self, name):
+        """
+        Saves the model, its config and the optimizer state to `checkpoints/<name>.pt`.
+        """
+        path = self.checkpoint_path(name)
+        self.trainer.save_checkpoint(path)
+        print(f"Exported checkpoint to {path}")
+
+    def load_checkpoint(self, name):
+        """
+        Loads `checkpoints/<name>.pt` into the current model and trainer.
+
+        A checkpoint saved with a different `ModelConfig` replaces the model and trainer with ones built from it.
+        The loaded data was encoded for the old config, so it is dropped and has to be loaded again.
+        """
+        path = self.checkpoint_path(name)
+        if not os.path.exists(path):
+            print(f"No checkpoint found at {path}")
+            return
+        try:
+            checkpoint = read_checkpoint(path)
+            config = ModelConfig.from_dict(checkpoint["config"])
+            if config.to_dict() != self.model.config.to_dict():
+                model = DataTransformerModel(config, **checkpoint["hparams"])
+                trainer = Trainer(model, config)
+                trainer.load_checkpoint(path)
+                self.model = trainer.model
+                self.trainer = trainer
+                self.engine = GenerationEngine(self.model)
+                print(f"Loaded checkpoint from {path} with a different config, please load a dataset for it.")
+                return
+            self.trainer.load_checkpoint(path)
+        except (ValueError, KeyError, RuntimeError) as e:
+            print(f"Could not load checkpoint {path}: {e}")
+            return
+        print(f"Loaded checkpoint from {path}")
+
+    def load_data(self, path):
+        """
+        Loads a JSON dataset into the trainer. The encoded form is kept in `<path>.encoded/` and reused by
+        later loads while the file and the model config are unchanged.
+        """
+        if not os.path.exists(path):
+            print(f"No dataset found at {path}")
+            return
+        self.trainer.load_data(path)
+        print(f"Loaded {len(self.trainer.source)} rows from {path}")
+
     def help(self):
         print("""
 ╔═══════════════════════════════════════════════════════════════════╗
@@ -94,6 +152,7 @@ class CLI:
 ║                                                                   ║
 ║  ➤  `load-`    : Import saved models from the `/checkpoints`      ║
 ║                  directory, relative to where this command is run.║
+║                  ie: `load-mymodel` loads checkpoints/mymodel.pt  ║
 ║                                                                   ║
 ╚═══════════════════════════════════════════════════════════════════╝
     """)
\ No newline at end of file
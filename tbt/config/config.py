@@ -12,13 +12,24 @@ import torch.nn.functional as F
 from typing import Dict, Union, Literal, Any, List
 import datetime
 import math
+import hashlib
+import json
 from tbt.translator.translator import Translator
 
+# Output heads a string field can use, see `ModelConfig.string`
+STRING_HEADS = ["dense", "factorized"]
+# Output heads a category field can use, see `ModelConfig.category`
+CATEGORY_HEADS = ["dense", "sampled", "adaptive"]
+
 class Layer:
-    def __init__(self, key, encode, decode, embedding_dim,datatype,character_set=[], max_len=0, normalizer=1.0,values=[], total_characters=0, date_pattern=""):
+    def __init__(self, key, encode, decode, embedding_dim,datatype,character_set=[], max_len=0, normalizer=1.0,values=[], total_characters=0, date_pattern="", encode_batch=None, decode_batch=None, translator=None, reserved_value="", head="dense"):
         self.key = key
         self.encode = encode
         self.decode = decode
+        self.encode_batch = encode_batch
+        self.decode_batch = decode_batch
+        self.translator = translator
+        self.reserved_value = reserved_value
         self.embedding_dim = embedding_dim
         self.datatype=datatype
         self.character_set=character_set
@@ -27,12 +38,76 @@ class Layer:
         self.values=values
         self.total_characters=total_characters
         self.date_pattern=date_pattern
+        self.head=head
+
+    def encode_column(self, values: List[Any]) -> torch.Tensor:
+        """ Encode a whole column of raw values with the batch translator. """
+        if self.datatype == "date":
+            return self.encode_batch(values, self.date_pattern)
+        return self.encode_batch(values)
+
+    def spec(self) -> Dict[str, Any]:
+        """ Everything that determines how this layer encodes/decodes data. """
+        return {
+            "key": self.key,
+            "datatype": self.datatype,
+            "embedding_dim": self.embedding_dim,
+            "character_set": list(self.character_set),
+            "max_len": self.max_len,
+            "normalizer": self.normalizer,
+            "values": list(self.values),
+            "total_characters": self.total_characters,
+            "date_pattern": self.date_pattern,
+            "reserved_value": self.reserved_value,
+            "head": self.head,
+        }
 
 class ModelConfig:
     def __init__(self):
         self.layers = {}
 
-    def string(self, key: str, max_len: int, character_set: list, reserved_value="\u0000"):
+    def fingerprint(self) -> str:
+        """
+        A hash of every registered layer. Changes whenever a key is added, replaced or reconfigured,
+        so anything derived from encoded data can tell when it's stale.
+        """
+        specs = [layer.spec() for layer in self.layers.values()]
+        return hashlib.sha256(json.dumps(specs, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ A JSON-serializable description of every layer. Rebuild the config with `ModelConfig.from_dict`. """
+        return {"layers": [layer.spec() for layer in self.layers.values()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ModelConfig":
+        config = cls()
+        for spec in data["layers"]:
+            key = spec["key"]
+            datatype = spec["datatype"]
+            if datatype == "string":
+                config.string(key, spec["max_len"], spec["character_set"], reserved_value=spec["reserved_value"], head=spec.get("head", "dense"))
+            elif datatype == "int":
+                config.int(key, normalizer=spec["normalizer"])
+            elif datatype == "float":
+                config.float(key, normalizer=spec["normalizer"])
+            elif datatype == "boolean":
+                config.boolean(key)
+            elif datatype == "date":
+                config.date(key, date_pattern=spec["date_pattern"])
+            elif datatype == "category":
+                config.category(key, spec["values"], head=spec.get("head", "dense"))
+            else:
+                raise ValueError(f"Unsupported datatype: {datatype}")
+        return config
+
+    def string(self, key: str, max_len: int, character_set: list, reserved_value="\u0000", head: str = "dense"):
+        """
+        `head` picks the output layer. "dense" is one linear from d_model to max_len * total_characters.
+        "factorized" shares one character classifier across positions and adds a learned embedding per position,
+        its parameters grow with max_len + total_characters instead of max_len * total_characters.
+        """
+        if head not in STRING_HEADS:
+            raise ValueError(f"Unsupported string head '{head}'. Use one of {STRING_HEADS}")
         # Logic for total values to predict
         distinct_characters = []
         for c in character_set:
@@ -43,30 +118,39 @@ class ModelConfig:
 
         self.total_characters = len(distinct_characters)
         t = Translator(datatype="string", info={"max_len": max_len, "character_set": character_set, "reserved_value": reserved_value})
-        l = Layer(key, t.encode, t.decode, embedding_dim=max_len, datatype="string", character_set=character_set, max_len=max_len, total_characters=len(distinct_characters))
+        l = Layer(key, t.encode, t.decode, embedding_dim=max_len, datatype="string", character_set=character_set, max_len=max_len, total_characters=len(distinct_characters), encode_batch=t.encode_batch, decode_batch=t.decode_batch, translator=t, reserved_value=reserved_value, head=head)
         self.layers[key] = l
 
     def int(self, key: str, normalizer:float=1.0):
         t = Translator(datatype="int")
-        l = Layer(key, t.encode, t.decode, embedding_dim=1,datatype="int", normalizer=normalizer)
+        l = Layer(key, t.encode, t.decode, embedding_dim=1,datatype="int", normalizer=normalizer, encode_batch=t.encode_batch, decode_batch=t.decode_batch, translator=t)
         self.layers[key] = l
 
     def float(self, key: str, normalizer:float=1.0):
         t = Translator(datatype="float")
-        l = Layer(key, t.encode, t.decode, embedding_dim=1,datatype="float", normalizer=normalizer)
+        l = Layer(key, t.encode, t.decode, embedding_dim=1,datatype="float", normalizer=normalizer, encode_batch=t.encode_batch, decode_batch=t.decode_batch, translator=t)
         self.layers[key] = l
 
     def boolean(self, key: str):
         t = Translator(datatype="boolean")
-        l = Layer(key, t.encode, t.decode, embedding_dim=1,datatype="boolean")
+        l = Layer(key, t.encode, t.decode, embedding_dim=1,datatype="boolean", encode_batch=t.encode_batch, decode_batch=t.decode_batch, translator=t)
         self.layers[key] = l
 
     def date(self, key: str, date_pattern:str='%m-%d-%Y'):
         t = Translator(datatype="date")
-        l = Layer(key, t.encode, t.decode, embedding_dim=3,datatype="date",date_pattern=date_pattern)  # 3 for year, month, day
+        l = Layer(key, t.encode, t.decode, embedding_dim=3,datatype="date",date_pattern=date_pattern, encode_batch=t.encode_batch, decode_batch=t.decode_batch, translator=t)  # 3 for year, month, day
         self.layers[key] = l
 
-    def category(self, key: str, values: list):
+    def category(self, key: str, values: list, head: str = "dense"):
+        """
+        `head` picks the output layer. "dense" is a linear with a full softmax over every value. For fields with
+        many values, "sampled" trains against a random sample of values and "adaptive" uses an adaptive softmax
+        (list `values` most frequent first). Both score every value exactly at inference.
+        """
+        if head not in CATEGORY_HEADS:
+            raise ValueError(f"Unsupported category head '{head}'. Use one of {CATEGORY_HEADS}")
+        if head == "adaptive" and len(values) < 2:
+            raise ValueError(f"The adaptive head needs at least 2 values, category '{key}' has {len(values)}")
         t = Translator(datatype="category", info={"values": values})
-        l = Layer(key, t.encode, t.decode, embedding_dim=1, datatype="category", values=values)  # Each category is a single value
+        l = Layer(key, t.encode, t.decode, embedding_dim=1, datatype="category", values=values, encode_batch=t.encode_batch, decode_batch=t.decode_batch, translator=t, head=head)  # Each category is a single value
         self.layers[key] = l
\ No newline at end of file
@@ -0,0 +1,182 @@
+import json
+import os
+import tempfile
+import torch
+from typing import Dict, Any, List, Optional, Tuple
+from tbt.dataset.dataset import EncodedDataset
+
+BINARY_FORMAT = 1
+HEADER_FILE = "header.json"
+CACHE_SUFFIX = ".encoded"
+GROUPS = ["source", "target", "loss_target"]
+
+
+def cache_path(path: str) -> str:
+    """ Where `load_dataset` keeps the encoded form of the dataset file at `path`. """
+    return path + CACHE_SUFFIX
+
+
+def file_stamp(path: str) -> Dict[str, int]:
+    """ Size and modification time of a file, enough to notice it was rewritten. """
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _dtype_name(dtype: torch.dtype) -> str:
+    return str(dtype).replace("torch.", "")
+
+
+def _write_column(tensor: torch.Tensor, path: str):
+    """ Writes the raw bytes of `tensor` to `path` through a shared mapping of a temporary file, then renames it. """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        if tensor.numel() > 0:
+            mapped = torch.from_file(tmp_path, shared=True, size=tensor.numel(), dtype=tensor.dtype)
+            mapped.copy_(tensor.reshape(-1))
+            del mapped
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_column(path: str, dtype: torch.dtype, shape: List[int]) -> torch.Tensor:
+    """
+    Memory-maps a column written by `_write_column`. Nothing is read until the pages are touched,
+    and the mapping is private: the file is never modified, and processes reading it share the page cache.
+    """
+    numel = 1
+    for dim in shape:
+        numel *= dim
+    if numel == 0:
+        return torch.empty(shape, dtype=dtype)
+    return torch.from_file(path, shared=False, size=numel, dtype=dtype).view(shape)
+
+
+def save_encoded(dataset: EncodedDataset, directory: str, source_file: Dict[str, int] = None):
+    """
+    Writes an `EncodedDataset` to `directory`: one contiguous .bin file per encoded column, plus a `header.json`
+    with the `ModelConfig` fingerprint, the row count and every column's dtype and shape.
+
+    `source_file` is the `file_stamp` of the file the dataset was read from, taken before reading it. It goes into
+    the header so a rewritten file isn't served from a stale cache.
+    The header is written last, a directory without one is ignored.
+    """
+    os.makedirs(directory, exist_ok=True)
+    header = {
+        "format": BINARY_FORMAT,
+        "fingerprint": dataset.fingerprint,
+        "size": dataset.size,
+        "source_file": source_file,
+        "columns": {},
+    }
+    columns = {"source": dataset.source, "target": dataset.target, "loss_target": dataset.loss_target}
+    for group in GROUPS:
+        header["columns"][group] = {}
+        for i, (key, tensor) in enumerate(columns[group].items()):
+            tensor = tensor.detach().cpu().contiguous()
+            # Keys can be any string, file names are positional
+            name = f"{group}_{i}.bin"
+            _write_column(tensor, os.path.join(directory, name))
+            header["columns"][group][key] = {"file": name, "dtype": _dtype_name(tensor.dtype), "shape": list(tensor.shape)}
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(header, f)
+    os.replace(tmp_path, os.path.join(directory, HEADER_FILE))
+
+
+def read_header(directory: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(directory, HEADER_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def load_encoded(directory: str, config, source_path: str = None) -> Optional[EncodedDataset]:
+    """
+    Memory-maps a dataset written by `save_encoded`. Returns None if there is none, or if it was encoded with a
+    different `ModelConfig` (by fingerprint) or from a different version of `source_path`.
+
+    Columns are zero-copy views of the files on the CPU, loading takes the same time whatever the number of rows.
+    """
+    header = read_header(directory)
+    if header is None or header.get("format") != BINARY_FORMAT or header["fingerprint"] != config.fingerprint():
+        return None
+    if source_path is not None and header["source_file"] != file_stamp(source_path):
+        return None
+    columns = {}
+    for group in GROUPS:
+        columns[group] = {
+            key: _read_column(os.path.join(directory, column["file"]), getattr(torch, column["dtype"]), column["shape"])
+            for key, column in header["columns"][group].items()
+        }
+    return EncodedDataset.from_columns(columns["source"], columns["target"], columns["loss_target"], header["fingerprint"])
+
+
+def read_records(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Source and target records of a dataset file, either JSON with the `{"source": [...], "target": [...]}` layout
+    or JSONL with one `{"source": {...}, "target": {...}}` pair per line.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            pairs = [json.loads(line) for line in f if line.strip()]
+            return [pair["source"] for pair in pairs], [pair["target"] for pair in pairs]
+        data = json.load(f)
+    return data["source"], data["target"]
+
+
+class EncodedRecords:
+    """
+    Read-only list-like view of encoded rows, decoded back to records one index at a time.
+    Stands in for the raw records of a dataset loaded from its binary form, which are never parsed.
+    """
+    def __init__(self, columns: Dict[str, torch.Tensor], model):
+        self.columns = columns
+        self.model = model
+        self.size = len(next(iter(columns.values()))) if columns else 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self.size))]
+        if idx < 0:
+            idx += self.size
+        if not 0 <= idx < self.size:
+            raise IndexError("EncodedRecords index out of range")
+        row = {key: tensor[idx:idx + 1] for key, tensor in self.columns.items()}
+        return self.model.to_records(self.model.decode_columns(row))[0]
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self[i]
+
+
+def load_dataset(path: str, model, cache: bool = True) -> EncodedDataset:
+    """
+    Encoded dataset for the JSON/JSONL file at `path` (see `read_records`).
+
+    With `cache` the encoded columns are kept next to the file in `<path>.encoded/`: the first load parses and encodes
+    the file and writes them, later loads memory-map them instead, as long as the file and the model's `ModelConfig`
+    are unchanged. The raw records of a memory-mapped dataset are `EncodedRecords` views.
+    """
+    directory = cache_path(path)
+    if cache:
+        dataset = load_encoded(directory, model.config, source_path=path)
+        if dataset is not None:
+            dataset.raw_source = EncodedRecords(dataset.source, model)
+            dataset.raw_target = EncodedRecords(dataset.target, model)
+            return dataset
+    stamp = file_stamp(path)
+    source, target = read_records(path)
+    dataset = EncodedDataset(source, target, model)
+    if cache:
+        save_encoded(dataset, directory, source_file=stamp)
+    return dataset
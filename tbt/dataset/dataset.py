@@ -0,0 +1,138 @@
+import torch
+from torch.utils.data import Dataset
+from typing import Dict, Any, List
+
+
+def loss_target(encoded: torch.Tensor, datatype: str) -> torch.Tensor:
+    """
+    Turns an encoded target column (see `Layer.encode_column`) into the tensor `Trainer.compute_loss` compares against.
+    Leading (row) dimensions are kept, so the result can be windowed the same way as the inputs.
+
+    category -> [N] class indices
+    string   -> [N, max_len] character indices
+    date     -> [N, 3] normalized year/month/day
+    int, float, boolean -> [N] values
+    """
+    if datatype == "category":
+        return encoded[..., 0]
+    elif datatype == "string":
+        return encoded.long()
+    elif datatype == "date":
+        return encoded.float()
+    elif datatype in ["int", "float", "boolean"]:
+        return encoded.float()[..., 0]
+    raise ValueError(f"Unsupported datatype: {datatype}")
+
+
+def window_index(size: int, window_size: int, stride: int) -> torch.Tensor:
+    """
+    Row indices of every window, shape [num_windows, window_size].
+
+    Windows start every `stride` rows. If the last window doesn't reach the final row,
+    one more window is added that ends on it, so every row is trained on.
+    """
+    if window_size <= 0 or stride <= 0:
+        raise ValueError(f"window_size and stride must be positive. Got window_size={window_size}, stride={stride}")
+    window_size = min(window_size, size)
+    starts = list(range(0, size - window_size + 1, stride))
+    if starts[-1] + window_size < size:
+        starts.append(size - window_size)
+    return torch.tensor(starts).unsqueeze(1) + torch.arange(window_size).unsqueeze(0)
+
+
+class EncodedDataset:
+    """
+    Source/target records translated once into tensors.
+
+    `source` and `target` hold the model inputs ({key: [N, embedding_dim]}), and
+    `loss_target` holds what each output head is trained against ({key: tensor}).
+
+    The dataset remembers the `ModelConfig` fingerprint and the lists it was built from,
+    use `is_valid()` to check it still matches before reusing it.
+    """
+    def __init__(self, source: List[Dict[str, Any]], target: List[Dict[str, Any]], model):
+        if len(source) != len(target):
+            raise Exception(f"Source to Target mappings must be equal in length. Source is {len(source)} and Taget is {len(target)}")
+        self.fingerprint = model.config.fingerprint()
+        self.raw_source = source
+        self.raw_target = target
+        self.size = len(source)
+        self.device = model.device
+        self.source = model.encode(source)
+        self.target = model.encode(target)
+        self.loss_target = {
+            key: loss_target(self.target[key], layer.datatype) for key, layer in model.config.layers.items()
+        }
+
+    @classmethod
+    def from_columns(cls, source: Dict[str, torch.Tensor], target: Dict[str, torch.Tensor], loss_targets: Dict[str, torch.Tensor], fingerprint: str, raw_source=None, raw_target=None) -> "EncodedDataset":
+        """ A dataset over columns that are already encoded, e.g. memory-mapped by `tbt.dataset.binary`. """
+        dataset = cls.__new__(cls)
+        dataset.fingerprint = fingerprint
+        dataset.raw_source = raw_source
+        dataset.raw_target = raw_target
+        dataset.size = len(next(iter(source.values()))) if source else 0
+        dataset.device = next(iter(source.values())).device if source else torch.device("cpu")
+        dataset.source = source
+        dataset.target = target
+        dataset.loss_target = loss_targets
+        return dataset
+
+    def __len__(self):
+        return self.size
+
+    def windows(self, window_size: int, stride: int = None):
+        """
+        Cuts the aligned rows into fixed length windows stacked along a batch dimension.
+
+        Returns (source, target, loss_target) dicts where every tensor is [num_windows, window_size, ...].
+        `stride` defaults to `window_size` (no overlap).
+        """
+        index = window_index(self.size, window_size, stride or window_size).to(self.device)
+        source = {key: tensor[index] for key, tensor in self.source.items()}
+        target = {key: tensor[index] for key, tensor in self.target.items()}
+        targets = {key: tensor[index] for key, tensor in self.loss_target.items()}
+        return source, target, targets
+
+    def is_valid(self, source: List[Dict[str, Any]], target: List[Dict[str, Any]], config) -> bool:
+        """
+        True if this dataset was built from these exact lists and the config hasn't changed since.
+        Rows edited in place are not detected, call `Trainer.add_data` again after doing that.
+        """
+        return (
+            self.raw_source is source
+            and self.raw_target is target
+            and self.size == len(source) == len(target)
+            and self.fingerprint == config.fingerprint()
+        )
+
+
+class WindowDataset(Dataset):
+    """
+    The windows of an `EncodedDataset` as a torch `Dataset`, for minibatch training with a `DataLoader`.
+
+    Windows are sliced out of the encoded columns on demand, so only the current batches are ever materialized.
+    Each item is a (source, target, loss_target) tuple of {key: [window_size, ...]} dicts, which the default
+    collate function stacks into [batch_size, window_size, ...].
+
+    The columns are kept on the CPU so `DataLoader` workers can share them, move batches to the model device after loading.
+    """
+    def __init__(self, dataset: EncodedDataset, window_size: int, stride: int = None):
+        index = window_index(dataset.size, window_size, stride or window_size)
+        self.starts = index[:, 0].tolist()
+        self.window_size = index.size(1)
+        self.source = {key: tensor.cpu() for key, tensor in dataset.source.items()}
+        self.target = {key: tensor.cpu() for key, tensor in dataset.target.items()}
+        self.loss_target = {key: tensor.cpu() for key, tensor in dataset.loss_target.items()}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, idx):
+        start = self.starts[idx]
+        end = start + self.window_size
+        return (
+            {key: tensor[start:end] for key, tensor in self.source.items()},
+            {key: tensor[start:end] for key, tensor in self.target.items()},
+            {key: tensor[start:end] for key, tensor in self.loss_target.items()},
+        )
@@ -0,0 +1,224 @@
+import itertools
+import json
+import random
+import re
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+from typing import Dict, Any, Iterator, List, Tuple
+from tbt.dataset.dataset import loss_target
+
+WHITESPACE = re.compile(r"\s*")
+
+
+class JSONReader:
+    """
+    Incremental reader over a JSON document in a file, holding only a bounded buffer in memory.
+    Values are parsed one at a time with `json.JSONDecoder.raw_decode`, reading more of the file whenever
+    a value runs past the end of the buffer.
+    """
+    def __init__(self, f, chunk_size: int = 1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+
+    def peek(self) -> str:
+        """ Next non-whitespace character, "" at the end of the file. """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.fill()
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' in JSON, found '{found}'")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the very end of the buffer may continue in the next read
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def items(self) -> Iterator[Any]:
+        """ Iterates the array starting at the current position, one item in memory at a time. """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, found '{separator}'")
+
+
+def iter_json_array(path: str, key: str, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    Streams the items of the top level `key` array of a JSON object file, e.g. "source" in
+    `{"source": [...], "target": [...]}`. Arrays before it are skipped item by item.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        reader = JSONReader(f, chunk_size)
+        reader.expect("{")
+        while reader.peek() != "}":
+            name = reader.value()
+            reader.expect(":")
+            if name == key:
+                yield from reader.items()
+                return
+            if reader.peek() == "[":
+                for _ in reader.items():
+                    pass
+            else:
+                reader.value()
+            if reader.peek() == ",":
+                reader.pos += 1
+    raise ValueError(f"No '{key}' array in {path}")
+
+
+def iter_jsonl(path: str) -> Iterator[str]:
+    """ Non-empty lines of a JSONL file, unparsed. """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+class StreamDataset(IterableDataset):
+    """
+    Windows of source/target rows streamed from a file, for minibatch training on data larger than memory
+    (see `Trainer.train_stream`).
+
+    `path` is either JSONL, one `{"source": {...}, "target": {...}}` pair per line, or a JSON file with the
+    `{"source": [...], "target": [...]}` layout. `format` ("jsonl" or "json") defaults to the file extension.
+
+    Rows are read and encoded `chunk_size` at a time, and each chunk also reads the first `window_size - 1`
+    rows of the next one so windows crossing the boundary are complete. Memory is bounded by the chunk size
+    (plus `shuffle_buffer` windows), not the file size. Windows are the same as `WindowDataset`'s: every `stride`
+    rows, plus one ending on the last row.
+
+    With `DataLoader` workers the chunks are split round-robin between them. For JSONL a worker only parses the
+    lines it needs, the JSON layout is parsed by every worker but encoded only once.
+
+    Items are (source, target, loss_target) tuples of {key: [window_size, ...]} CPU tensors.
+    """
+    def __init__(self, path: str, config, window_size: int, stride: int = None, chunk_size: int = 4096, shuffle_buffer: int = 0, format: str = None):
+        if window_size <= 0 or (stride is not None and stride <= 0):
+            raise ValueError(f"window_size and stride must be positive. Got window_size={window_size}, stride={stride}")
+        self.path = path
+        self.config = config
+        self.window_size = window_size
+        self.stride = stride or window_size
+        # A chunk plus its lookahead must be able to hold any window starting in the chunk
+        self.chunk_size = max(chunk_size, window_size)
+        self.shuffle_buffer = shuffle_buffer
+        self.format = format or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "json")
+        if self.format not in ["jsonl", "json"]:
+            raise ValueError(f"Unsupported format '{self.format}'. Use 'jsonl' or 'json'")
+
+    def rows(self) -> Iterator[Any]:
+        """ Raw rows in file order, turned into (source, target) pairs by `parse`. """
+        if self.format == "jsonl":
+            return iter_jsonl(self.path)
+        return self._pairs(iter_json_array(self.path, "source"), iter_json_array(self.path, "target"))
+
+    def _pairs(self, source: Iterator[Any], target: Iterator[Any]) -> Iterator[Tuple[Any, Any]]:
+        missing = object()
+        for i, pair in enumerate(itertools.zip_longest(source, target, fillvalue=missing)):
+            if missing in pair:
+                raise Exception(f"Source to Target mappings must be equal in length. {self.path} has a different number of rows after row {i}")
+            yield pair
+
+    def parse(self, row) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        if self.format == "jsonl":
+            pair = json.loads(row)
+            return pair["source"], pair["target"]
+        return row
+
+    def segments(self, worker: int, workers: int) -> Iterator[Tuple[int, List[Any], int]]:
+        """
+        Yields (start, rows, total) for every chunk this worker owns: the chunk's rows plus the lookahead into the
+        next chunk. `total` is the number of rows in the file if the segment reached the end, else None.
+        """
+        span = self.chunk_size + self.window_size - 1
+        # A chunk and the next one's segment overlap by the lookahead, so up to two are open at once
+        open_segments = []
+        size = 0
+        for i, row in enumerate(self.rows()):
+            while open_segments and open_segments[0][0] + span <= i:
+                start, rows = open_segments.pop(0)
+                yield start, rows, None
+            if i % self.chunk_size == 0 and (i // self.chunk_size) % workers == worker:
+                open_segments.append((i, []))
+            if open_segments:
+                pair = self.parse(row)
+                for start, rows in open_segments:
+                    rows.append(pair)
+            size = i + 1
+        for start, rows in open_segments:
+            yield start, rows, size
+
+    def encode(self, records: List[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
+        # Same as `DataTransformerModel.encode`, kept on the CPU
+        return {key: layer.encode_column([record[key] for record in records]).float() for key, layer in self.config.layers.items()}
+
+    def windows(self, worker: int = 0, workers: int = 1) -> Iterator[Tuple[Dict[str, torch.Tensor], ...]]:
+        """ Every window starting in a chunk this worker owns, in file order. """
+        for start, rows, total in self.segments(worker, workers):
+            source = self.encode([pair[0] for pair in rows])
+            target = self.encode([pair[1] for pair in rows])
+            targets = {key: loss_target(target[key], layer.datatype) for key, layer in self.config.layers.items()}
+            end = start + len(rows)
+            window_size = min(self.window_size, end) if total is not None else self.window_size
+            starts = list(range(-(-start // self.stride) * self.stride, min(start + self.chunk_size, end - window_size + 1), self.stride))
+            # Like `window_index`, one more window ending on the last row if the regular ones don't reach it
+            tail = total - window_size if total is not None else None
+            if tail is not None and start <= tail < start + self.chunk_size and tail % self.stride != 0:
+                starts.append(tail)
+            for window_start in starts:
+                offset = window_start - start
+                yield (
+                    {key: tensor[offset:offset + window_size] for key, tensor in source.items()},
+                    {key: tensor[offset:offset + window_size] for key, tensor in target.items()},
+                    {key: tensor[offset:offset + window_size] for key, tensor in targets.items()},
+                )
+
+    def __iter__(self):
+        info = get_worker_info()
+        windows = self.windows(info.id, info.num_workers) if info is not None else self.windows()
+        if self.shuffle_buffer <= 1:
+            yield from windows
+            return
+        # Shuffle within a bounded buffer, a full shuffle would need the whole file
+        buffer = []
+        for window in windows:
+            buffer.append(window)
+            if len(buffer) >= self.shuffle_buffer:
+                index = random.randrange(len(buffer))
+                buffer[index], buffer[-1] = buffer[-1], buffer[index]
+                yield buffer.pop()
+        random.shuffle(buffer)
+        yield from buffer
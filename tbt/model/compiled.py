@@ -0,0 +1,132 @@
+import copy
+import json
+import zipfile
+import torch
+from torch.export import Dim
+from torch.export.pt2_archive import PT2ArchiveReader
+from typing import Dict, Any, List, Union
+from tbt.config.config import ModelConfig
+from tbt.model.model import DataTransformerModel
+
+BACKENDS = ["aoti", "export"]
+METADATA_FILE = "tbt.json"
+
+
+def example_inputs(config: ModelConfig, batch_size: int = 2, src_len: int = 8, tgt_len: int = 4):
+    """ Random encoded (src, tgt) dicts with the shapes `DataTransformerModel.forward` takes, used for tracing. """
+    src = {key: torch.randn(batch_size, src_len, layer.embedding_dim) for key, layer in config.layers.items()}
+    tgt = {key: torch.randn(batch_size, tgt_len, layer.embedding_dim) for key, layer in config.layers.items()}
+    return src, tgt
+
+
+def export_core(model: DataTransformerModel) -> torch.export.ExportedProgram:
+    """
+    Captures the tensor-only part of the forward pass (embeddings, projection, positional encoding,
+    encoder/decoder and heads) with `torch.export`, for encoded [batch, seq_len, embedding_dim] inputs.
+    Batch size and both sequence lengths stay dynamic, sequences up to the model's `max_len`.
+    """
+    was_training = model.training
+    model.eval()
+    max_len = model.hparams["max_len"]
+    batch = Dim("batch")
+    src_len = Dim("src_len", max=max_len)
+    tgt_len = Dim("tgt_len", max=max_len)
+    dynamic_shapes = (
+        {key: {0: batch, 1: src_len} for key in model.config.layers},
+        {key: {0: batch, 1: tgt_len} for key in model.config.layers},
+    )
+    try:
+        with torch.no_grad():
+            return torch.export.export(model, example_inputs(model.config), dynamic_shapes=dynamic_shapes)
+    finally:
+        model.train(was_training)
+
+
+def compile_model(model: DataTransformerModel, path: str, backend: str = "aoti") -> str:
+    """
+    Writes a compiled inference artifact for `model` to `path` (a .pt2 archive) and returns the path.
+
+    "aoti" compiles the exported graph ahead of time with TorchInductor into a shared library inside the archive,
+    this is the fast one but needs a C++ compiler while compiling. "export" saves the exported graph as is.
+    The `ModelConfig` goes into the archive as JSON, so `load_compiled` needs nothing but the file.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported backend '{backend}'. Use one of {BACKENDS}")
+    model = copy.deepcopy(model).to("cpu")
+    model.device = torch.device("cpu")
+    program = export_core(model)
+    metadata = json.dumps({"backend": backend, "config": model.config.to_dict(), "hparams": model.hparams})
+    if backend == "export":
+        torch.export.save(program, path, extra_files={METADATA_FILE: metadata})
+        return path
+    path = torch._inductor.aoti_compile_and_package(program, package_path=path)
+    # Same place torch.export.save puts extra files, inside the archive's top level folder
+    with zipfile.ZipFile(path, "a") as archive:
+        root = archive.namelist()[0].split("/")[0]
+        archive.writestr(f"{root}/extra/{METADATA_FILE}", metadata)
+    return path
+
+
+def load_compiled(path: str) -> "CompiledModel":
+    """ Loads an artifact written by `compile_model`. """
+    metadata = json.loads(PT2ArchiveReader(path).read_string(f"extra/{METADATA_FILE}"))
+    if metadata["backend"] == "aoti":
+        core = torch._inductor.aoti_load_package(path)
+    else:
+        core = torch.export.load(path).module()
+    return CompiledModel(core, ModelConfig.from_dict(metadata["config"]), metadata["hparams"])
+
+
+class CompiledModel:
+    """
+    Inference-only stand-in for a `DataTransformerModel`, running a compiled core from `compile_model`.
+
+    Records are encoded and outputs decoded in Python exactly as `DataTransformerModel` does, using the
+    `ModelConfig` stored in the artifact. Everything in between is the compiled graph. Runs on CPU.
+    """
+    # Translation on either side of the core only needs `self.config` and `self.device`
+    encode = DataTransformerModel.encode
+    sample_encoded = DataTransformerModel.sample_encoded
+    decode_columns = DataTransformerModel.decode_columns
+    predict = DataTransformerModel.predict
+    to_records = DataTransformerModel.to_records
+
+    def __init__(self, core, config: ModelConfig, hparams: Dict[str, Any]):
+        self.core = core
+        self.config = config
+        self.hparams = hparams
+        self.device = torch.device("cpu")
+
+    def _as_encoded(self, rows: Union[Dict[str, Any], List[Dict[str, Any]], Dict[str, torch.Tensor]]) -> Dict[str, torch.Tensor]:
+        """ Accepts a record, a list of records or encoded tensors and returns dense [batch, seq_len, ...] tensors. """
+        if isinstance(rows, dict) and not all(isinstance(value, torch.Tensor) for value in rows.values()):
+            rows = [rows]
+        if not isinstance(rows, dict):
+            rows = self.encode(rows)
+        # The compiled kernels assume dense row-major inputs, expanded or sliced views are copied first
+        return {key: (rows[key] if rows[key].dim() == 3 else rows[key].unsqueeze(0)).contiguous() for key in self.config.layers}
+
+    def __call__(self, src: Union[Dict[str, Any], List[Dict[str, Any]], Dict[str, torch.Tensor]], tgt: Union[Dict[str, Any], List[Dict[str, Any]], Dict[str, torch.Tensor]]) -> Dict[str, torch.Tensor]:
+        """ Same inputs and outputs as `DataTransformerModel.forward`. """
+        with torch.no_grad():
+            return self.core(self._as_encoded(src), self._as_encoded(tgt))
+
+    def generate(self, source, initial_target, N: int, temperature: float = 0.0, noise_scale: float = 0.1) -> List[Dict[str, Any]]:
+        """
+        Generates `N` rows following `initial_target`, conditioned on `source`, by running the full forward pass
+        over the growing target and taking the prediction for its last position (see `sample_encoded`).
+
+        The forward pass is causal and predicts each row from the rows before it, so every step appends a placeholder
+        row (a copy of the last one, never looked at) and reads the output at its position.
+        Returns the "original" form of every generated row.
+        """
+        source = self._as_encoded(source)
+        target = self._as_encoded(initial_target)
+        steps = []
+        for _ in range(N):
+            output = self(source, {key: torch.cat([tensor, tensor[:, -1:]], dim=1) for key, tensor in target.items()})
+            row = self.sample_encoded({key: tensor[:, -1:] for key, tensor in output.items()}, temperature=temperature, noise_scale=noise_scale)
+            steps.append(row)
+            target = {key: torch.cat([target[key], row[key]], dim=1) for key in target}
+        encoded = {key: torch.cat([step[key] for step in steps], dim=1) for key in self.config.layers}
+        return self.to_records(self.decode_columns(encoded))
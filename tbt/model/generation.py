@@ -0,0 +1,216 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from typing import Dict, Any, List, Union, Optional
+from tbt.utils.utils import stringdate
+
+
+class DecoderLayerCache:
+    """
+    Key/value cache for one `nn.TransformerDecoderLayer`.
+
+    `self_k`/`self_v` grow by one position per decoded row, `cross_k`/`cross_v` are
+    projected from the encoder memory once and reused for every step.
+    Tensors are [batch, nhead, seq_len, head_dim].
+    """
+    def __init__(self, cross_k: torch.Tensor, cross_v: torch.Tensor):
+        self.self_k: Optional[torch.Tensor] = None
+        self.self_v: Optional[torch.Tensor] = None
+        self.cross_k = cross_k
+        self.cross_v = cross_v
+
+
+class GenerationState:
+    """
+    Everything needed to extend a generation by another row: the cached encoder memory,
+    the per-layer decoder caches and how many target rows have been decoded so far.
+    """
+    def __init__(self, memory: torch.Tensor, caches: List[DecoderLayerCache]):
+        self.memory = memory
+        self.caches = caches
+        self.length = 0
+
+
+class GenerationEngine:
+    """
+    Autoregressive generation for a `DataTransformerModel`.
+
+    The source is encoded once and its memory cached, and the decoder is extended one row at a time
+    with key/value caching in every layer, so generating N rows costs about N single-row decoder passes
+    instead of N full encoder+decoder passes.
+
+    Decoding is causal: each new row attends to the rows before it (and itself), never to later ones.
+    """
+    def __init__(self, model):
+        self.model = model
+        self._memory_source = None
+        self._memory_key = None
+        self._memory = None
+
+    def _split_heads(self, x: torch.Tensor, nhead: int) -> torch.Tensor:
+        batch_size, seq_len, d_model = x.shape
+        return x.view(batch_size, seq_len, nhead, d_model // nhead).transpose(1, 2)
+
+    def _merge_heads(self, x: torch.Tensor) -> torch.Tensor:
+        batch_size, nhead, seq_len, head_dim = x.shape
+        return x.transpose(1, 2).reshape(batch_size, seq_len, nhead * head_dim)
+
+    def _project(self, attention: nn.MultiheadAttention, x: torch.Tensor, index: int) -> torch.Tensor:
+        """ Apply the q (0), k (1) or v (2) slice of a MultiheadAttention input projection. """
+        d_model = attention.embed_dim
+        weight = attention.in_proj_weight[index * d_model:(index + 1) * d_model]
+        bias = attention.in_proj_bias[index * d_model:(index + 1) * d_model] if attention.in_proj_bias is not None else None
+        return self._split_heads(F.linear(x, weight, bias), attention.num_heads)
+
+    def _attend(self, attention: nn.MultiheadAttention, query: torch.Tensor, k: torch.Tensor, v: torch.Tensor, is_causal: bool) -> torch.Tensor:
+        q = self._project(attention, query, 0)
+        if is_causal and q.size(2) != k.size(2):
+            # New rows after cached ones: row i sees every cached row plus the new rows up to itself
+            mask = torch.ones(q.size(2), k.size(2), dtype=torch.bool, device=q.device).tril(k.size(2) - q.size(2))
+            attended = F.scaled_dot_product_attention(q, k, v, attn_mask=mask)
+        else:
+            attended = F.scaled_dot_product_attention(q, k, v, is_causal=is_causal)
+        return attention.out_proj(self._merge_heads(attended))
+
+    def _self_attention(self, layer: nn.TransformerDecoderLayer, x: torch.Tensor, cache: DecoderLayerCache) -> torch.Tensor:
+        k = self._project(layer.self_attn, x, 1)
+        v = self._project(layer.self_attn, x, 2)
+        is_causal = x.size(1) > 1
+        cache.self_k = k if cache.self_k is None else torch.cat([cache.self_k, k], dim=2)
+        cache.self_v = v if cache.self_v is None else torch.cat([cache.self_v, v], dim=2)
+        return self._attend(layer.self_attn, x, cache.self_k, cache.self_v, is_causal)
+
+    def _feed_forward(self, layer: nn.TransformerDecoderLayer, x: torch.Tensor) -> torch.Tensor:
+        return layer.linear2(layer.activation(layer.linear1(x)))
+
+    def _decoder_layer(self, layer: nn.TransformerDecoderLayer, x: torch.Tensor, cache: DecoderLayerCache) -> torch.Tensor:
+        # Same computation as nn.TransformerDecoderLayer.forward in eval mode, over the new rows only
+        if layer.norm_first:
+            x = x + self._self_attention(layer, layer.norm1(x), cache)
+            x = x + self._attend(layer.multihead_attn, layer.norm2(x), cache.cross_k, cache.cross_v, False)
+            x = x + self._feed_forward(layer, layer.norm3(x))
+        else:
+            x = layer.norm1(x + self._self_attention(layer, x, cache))
+            x = layer.norm2(x + self._attend(layer.multihead_attn, x, cache.cross_k, cache.cross_v, False))
+            x = layer.norm3(x + self._feed_forward(layer, x))
+        return x
+
+    def _as_encoded(self, rows: Union[Dict[str, Any], List[Dict[str, Any]], Dict[str, torch.Tensor]]) -> Dict[str, torch.Tensor]:
+        """ Accepts a record, a list of records or encoded tensors and returns [batch, seq_len, ...] tensors. """
+        if isinstance(rows, dict) and not all(isinstance(value, torch.Tensor) for value in rows.values()):
+            rows = [rows]
+        if not isinstance(rows, dict):
+            rows = self.model.encode(rows)
+        return {key: tensor if tensor.dim() == 3 else tensor.unsqueeze(0) for key, tensor in rows.items()}
+
+    @torch.no_grad()
+    def encode_source(self, source) -> torch.Tensor:
+        """
+        Runs the encoder over `source` and returns the memory, [batch, seq_len, d_model].
+        The memory is reused for as long as the same source object is passed in and neither the config nor
+        the weights changed (training steps and loaded checkpoints bump the parameter versions).
+        """
+        key = (self.model.config.fingerprint(), tuple((parameter.data_ptr(), parameter._version) for parameter in self.model.parameters()))
+        if self._memory is not None and self._memory_source is source and self._memory_key == key:
+            return self._memory
+        model = self.model
+        with model.autocast():
+            memory = model.encoder(model.positional_encoding(model.embed(self._as_encoded(source))))
+        self._memory_source = source
+        self._memory_key = key
+        self._memory = memory
+        return memory
+
+    @torch.no_grad()
+    def start(self, source, batch_size: int = 1) -> GenerationState:
+        """ Encode (or reuse) the source memory and build empty decoder caches for `batch_size` sequences. """
+        memory = self.encode_source(source)
+        caches = []
+        for layer in self.model.decoder.layers:
+            # Project the memory once, then broadcast it over the batch without copying
+            with self.model.autocast():
+                cross_k = self._project(layer.multihead_attn, memory, 1)
+                cross_v = self._project(layer.multihead_attn, memory, 2)
+            if memory.size(0) != batch_size:
+                cross_k = cross_k.expand(batch_size, -1, -1, -1)
+                cross_v = cross_v.expand(batch_size, -1, -1, -1)
+            caches.append(DecoderLayerCache(cross_k, cross_v))
+        return GenerationState(memory, caches)
+
+    @torch.no_grad()
+    def step(self, state: GenerationState, rows) -> Dict[str, torch.Tensor]:
+        """
+        Appends `rows` (records or encoded tensors) to the decoded sequence and returns the model
+        output for the last appended position, {key: [batch, 1, ...]}: the prediction for the row after them.
+
+        Like `DataTransformerModel.forward`, the sequence starts with the model's `start_row`, added on the first step.
+        """
+        model = self.model
+        with model.autocast():
+            x = model.embed(self._as_encoded(rows))
+            if state.length == 0:
+                x = torch.cat([model.start_row.to(x.dtype).expand(x.size(0), 1, -1), x], dim=1)
+            x = model.positional_encoding(x, offset=state.length)
+            state.length += x.size(1)
+            for layer, cache in zip(model.decoder.layers, state.caches):
+                x = self._decoder_layer(layer, x, cache)
+            if model.decoder.norm is not None:
+                x = model.decoder.norm(x)
+            return model.project_output(x[:, -1:])
+
+    @torch.no_grad()
+    def generate(self, source, initial_target, N: int) -> List[Dict[str, Any]]:
+        """
+        Generates `N` rows following `initial_target`, conditioned on `source`.
+        Each step takes the most likely value of every head and feeds it back in encoded form
+        (see `DataTransformerModel.sample_encoded`), rows are only decoded at the end.
+        Returns the "original" form of every generated row.
+        """
+        self.model.eval()
+        state = self.start(source)
+        output = self.step(state, initial_target)
+        steps = []
+        for i in range(N):
+            encoded = self.model.sample_encoded(output, temperature=0)
+            steps.append(encoded)
+            if i < N - 1:
+                output = self.step(state, encoded)
+        return self.decode_trajectories(steps, 1, N)[0]
+
+    @torch.no_grad()
+    def sample(self, source, initial_target, N: int, trajectories: int = 1, temperature: float = 1.0, noise_scale: float = 0.1) -> List[List[Dict[str, Any]]]:
+        """
+        Samples `trajectories` independent futures of `N` rows each, following `initial_target` and conditioned on `source`.
+
+        All trajectories run as one batch, so every step is a single decoder pass. Sampled rows stay in
+        encoded form between steps (see `DataTransformerModel.sample_encoded`) and are only decoded at the end.
+
+        Returns one list of rows ("original" form) per trajectory.
+        """
+        model = self.model
+        model.eval()
+        state = self.start(source, batch_size=trajectories)
+        initial = {key: tensor.expand(trajectories, -1, -1) for key, tensor in self._as_encoded(initial_target).items()}
+        output = self.step(state, initial)
+        steps = []
+        for i in range(N):
+            encoded = model.sample_encoded(output, temperature=temperature, noise_scale=noise_scale)
+            steps.append(encoded)
+            if i < N - 1:
+                output = self.step(state, encoded)
+        return self.decode_trajectories(steps, trajectories, N)
+
+    def decode_trajectories(self, steps: List[Dict[str, torch.Tensor]], trajectories: int, N: int) -> List[List[Dict[str, Any]]]:
+        """ Decode a list of per-step encoded rows ({key: [trajectories, 1, ...]}) into rows, one list per trajectory. """
+        columns = {}
+        for key, layer in self.model.config.layers.items():
+            # [trajectories, N, embedding_dim] -> [trajectories * N, embedding_dim], trajectory major
+            stacked = torch.cat([step[key] for step in steps], dim=1)
+            values = layer.decode_batch(stacked.reshape(trajectories * N, -1))
+            if layer.datatype == "date":
+                values = [stringdate(value, layer.date_pattern) for value in values]
+            columns[key] = values
+        return [
+            [{key: columns[key][t * N + i] for key in columns} for i in range(N)]
+            for t in range(trajectories)
+        ]
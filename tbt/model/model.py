@@ -8,7 +8,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import math
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Union, Tuple
 from tbt.config.config import ModelConfig
 from tbt.utils.utils import stringdate
 
@@ -24,16 +24,111 @@ class PositionalEncoding(nn.Module):
         pe = pe.unsqueeze(0).transpose(0, 1)
         self.register_buffer('pe', pe)
     
+    def forward(self, x, offset=0):
+        # Batch first input [batch, seq_len, d_model], one position per row of each sequence.
+        # `offset` is the position of the first row, used when a sequence is extended step by step.
+        if offset + x.size(1) > self.pe.size(0):
+            raise ValueError(f"Sequence length {offset + x.size(1)} is longer than the positional encoding max_len {self.pe.size(0)}. Train with a smaller window_size.")
+        return x + self.pe[offset:offset + x.size(1)].transpose(0, 1)
+
+class FactorizedStringHead(nn.Module):
+    """
+    String output head with one character classifier shared by every position.
+    Each position adds its own embedding to the decoder output before classification, so the parameters are
+    d_model * (max_len + total_characters) instead of d_model * max_len * total_characters.
+    Output has the dense head's layout, [..., max_len * total_characters] logits.
+    """
+    def __init__(self, d_model, max_len, total_characters):
+        super(FactorizedStringHead, self).__init__()
+        self.positions = nn.Embedding(max_len, d_model)
+        self.characters = nn.Linear(d_model, total_characters)
+        self.out_features = max_len * total_characters
+
+    def forward(self, x):
+        # [..., d_model] -> [..., max_len, d_model], the nonlinearity keeps the position from being a plain logit bias
+        hidden = F.gelu(x.unsqueeze(-2) + self.positions.weight)
+        return self.characters(hidden).flatten(-2)
+
+class SampledSoftmaxHead(nn.Module):
+    """
+    Category head for many values. Inference computes the full logits, so argmax and top-k are exact.
+    Training (`loss`) scores the target against `num_samples` uniformly sampled values instead of all of them.
+    """
+    def __init__(self, d_model, num_classes, num_samples=1024):
+        super(SampledSoftmaxHead, self).__init__()
+        self.linear = nn.Linear(d_model, num_classes)
+        self.num_samples = min(num_samples, num_classes)
+        self.out_features = num_classes
+
     def forward(self, x):
-        x = x + self.pe[:x.size(0), :]
-        return x
+        return self.linear(x)
+
+    def loss(self, hidden, target):
+        hidden = hidden.reshape(-1, hidden.size(-1))
+        target = target.reshape(-1).long()
+        # One set of negatives shared by every row. Uniform sampling shifts every logit by the same
+        # log-probability correction, which cancels out in the softmax.
+        negatives = torch.randint(0, self.out_features, (self.num_samples,), device=hidden.device)
+        true_logits = (hidden * self.linear.weight[target]).sum(-1, keepdim=True) + self.linear.bias[target].unsqueeze(-1)
+        sampled_logits = F.linear(hidden, self.linear.weight[negatives], self.linear.bias[negatives])
+        # A sampled value that is the row's own target isn't a negative
+        sampled_logits = sampled_logits.masked_fill(negatives.unsqueeze(0) == target.unsqueeze(1), float("-inf"))
+        logits = torch.cat([true_logits, sampled_logits], dim=-1)
+        return F.cross_entropy(logits, torch.zeros_like(target))
+
+
+class AdaptiveSoftmaxHead(nn.Module):
+    """
+    Category head using `nn.AdaptiveLogSoftmaxWithLoss`: the first values get a full softmax, the rest sit in
+    smaller, cheaper tail clusters. Values should be listed most frequent first.
+    Inference returns exact log-probabilities for every value.
+    """
+    def __init__(self, d_model, num_classes):
+        super(AdaptiveSoftmaxHead, self).__init__()
+        # Head covers the most frequent 5%, then clusters up to 25% and the rest
+        cutoffs = sorted({cutoff for cutoff in (num_classes // 20, num_classes // 4) if 0 < cutoff < num_classes})
+        if not cutoffs:
+            # Too few values for those, split them in half (`nn.AdaptiveLogSoftmaxWithLoss` needs a cutoff)
+            cutoffs = [max(1, num_classes // 2)]
+        self.adaptive = nn.AdaptiveLogSoftmaxWithLoss(d_model, num_classes, cutoffs=cutoffs, div_value=4.0)
+        self.out_features = num_classes
+
+    def forward(self, x):
+        return self.adaptive.log_prob(x.reshape(-1, x.size(-1))).view(*x.shape[:-1], self.out_features)
+
+    def loss(self, hidden, target):
+        loss = self.adaptive(hidden.reshape(-1, hidden.size(-1)), target.reshape(-1).long()).loss
+        # Clusters with no value in the batch would get no gradient at all, which DistributedDataParallel rejects.
+        # A zero-weighted term gives them a zero gradient (the loss runs outside forward, so find_unused_parameters can't help)
+        return loss + 0.0 * sum(parameter.sum() for parameter in self.adaptive.tail.parameters())
+
+PRECISIONS = ["fp32", "bf16"]
 
 class DataTransformerModel(nn.Module):
-    def __init__(self, config, d_model=64, nhead=4, num_encoder_layers=3, num_decoder_layers=3, dim_feedforward=256, dropout=0.1, max_len=5000, output_scale=1.0):
+    def __init__(self, config, d_model=64, nhead=4, num_encoder_layers=3, num_decoder_layers=3, dim_feedforward=256, dropout=0.1, max_len=5000, output_scale=1.0, precision="fp32", fused=True):
         super(DataTransformerModel, self).__init__()
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.config = config
         self.output_scale = output_scale
+        self.precision = precision
+        # Run the per-key embeddings and output heads as one packed linear each (see `embed` and `project_output`).
+        # Clearly faster for single-row generation steps, about even for large batches and training (see benchmark.py)
+        self.fused = fused
+        # Packed weights kept for inference, {name: (parameter versions, (weight, bias))}, see `packed`
+        self._packed_cache = {}
+        # Constructor arguments, stored with checkpoints so the model can be rebuilt
+        self.hparams = {
+            "d_model": d_model,
+            "nhead": nhead,
+            "num_encoder_layers": num_encoder_layers,
+            "num_decoder_layers": num_decoder_layers,
+            "dim_feedforward": dim_feedforward,
+            "dropout": dropout,
+            "max_len": max_len,
+            "output_scale": output_scale,
+            "precision": precision,
+            "fused": fused,
+        }
 
         # Embedding layers dictionary
         self.embeddings = nn.ModuleDict()
@@ -47,6 +142,9 @@ class DataTransformerModel(nn.Module):
 
         self.positional_encoding = PositionalEncoding(d_model, max_len=max_len)
 
+        # Decoder input for the first target position, which has no earlier target row to look at (see `forward`)
+        self.start_row = nn.Parameter(torch.zeros(1, 1, d_model))
+
         # Output layers for each key
         self.output_layers = nn.ModuleDict({
             key: self._get_output_layer(layer, d_model) for key, layer in config.layers.items()
@@ -59,10 +157,38 @@ class DataTransformerModel(nn.Module):
         # New layer to project concatenated embeddings back to `d_model` size
         total_embedding_dim = sum(layer.embedding_dim for layer in config.layers.values())
         self.concat_projection = nn.Linear(total_embedding_dim, d_model)
+
+        # Heads that are plain linears get packed together, the column layout of the packed output
+        # and the factor each column is multiplied by (normalizer for int/float)
+        self.packed_keys = [key for key in config.layers.keys() if type(self.output_layers[key]) is nn.Linear]
+        self.output_sizes = [self.output_layers[key].out_features for key in self.packed_keys]
+        output_normalizer = torch.cat([
+            torch.full((size,), float(config.layers[key].normalizer) if config.layers[key].datatype in ['int', 'float'] else 1.0)
+            for size, key in zip(self.output_sizes, self.packed_keys)
+        ]) if self.packed_keys else torch.zeros(0)
+        self.register_buffer('output_normalizer', output_normalizer, persistent=False)
         
         # Move the entire model to the appropriate device
         self.to(self.device)
 
+    @property
+    def precision(self):
+        return self._precision
+
+    @precision.setter
+    def precision(self, precision):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported precision '{precision}'. Use one of {PRECISIONS}")
+        self._precision = precision
+        self.hparams = {**getattr(self, "hparams", {}), "precision": precision}
+
+    def autocast(self):
+        """
+        Autocast context for the embeddings, encoder/decoder and output heads.
+        With precision "bf16" their matmuls run in bfloat16, "fp32" leaves everything in float32.
+        """
+        return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16, enabled=self.precision == "bf16")
+
     def _get_output_layer(self, layer, d_model):
         if layer.datatype == "boolean":
             return nn.Linear(d_model, 2)
@@ -71,64 +197,169 @@ class DataTransformerModel(nn.Module):
         elif layer.datatype == "float":
             return nn.Linear(d_model, 1)
         elif layer.datatype == "string":
+            if layer.head == "factorized":
+                return FactorizedStringHead(d_model, layer.max_len, layer.total_characters)
             return nn.Linear(d_model, layer.total_characters * layer.max_len)
         elif layer.datatype == "date":
             return nn.Linear(d_model, 3)
         elif layer.datatype == "category":
+            if layer.head == "sampled":
+                return SampledSoftmaxHead(d_model, len(layer.values))
+            elif layer.head == "adaptive":
+                return AdaptiveSoftmaxHead(d_model, len(layer.values))
             return nn.Linear(d_model, len(layer.values))
         else:
             return nn.Linear(d_model, layer.embedding_dim)
 
-    def forward(self, src: List[Dict[str, Any]], tgt: List[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
-        # Initialize list to hold all embeddings for concatenation
-        src_embeddings = []
-        tgt_embeddings = []
-
+    def encode(self, records: List[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
+        """ Encode a list of records into one [N, embedding_dim] float tensor per key, on the model device. """
+        encoded = {}
         for key, layer in self.config.layers.items():
             try:
-                if layer.datatype == "date":
-                    encoded_src = torch.stack([layer.encode(obj[key], layer.date_pattern).float().to(self.device) for obj in src])
-                    encoded_tgt = torch.stack([layer.encode(obj[key], layer.date_pattern).float().to(self.device) for obj in tgt])
-                else:
-                    encoded_src = torch.stack([layer.encode(obj[key]).float().to(self.device) for obj in src])
-                    encoded_tgt = torch.stack([layer.encode(obj[key]).float().to(self.device) for obj in tgt])
+                # One column -> one tensor allocation and one device transfer
+                encoded[key] = layer.encode_column([obj[key] for obj in records]).float().to(self.device)
             except Exception as e:
                 print(f"Error processing key: {key} with error: {str(e)}")
-                print(f"Source data for key: {src}")
-                print(f"Target data for key: {tgt}")
+                print(f"Data for key: {records}")
                 raise e
+        return encoded
 
-            # Get the embeddings and add them to the list for concatenation
-            src_embedded = self.embeddings[key](encoded_src)  # Shape: (batch_size, seq_len, layer.embedding_dim)
-            tgt_embedded = self.embeddings[key](encoded_tgt)
-            src_embeddings.append(src_embedded)
-            tgt_embeddings.append(tgt_embedded)
+    def forward(self, src: Union[List[Dict[str, Any]], Dict[str, torch.Tensor]], tgt: Union[List[Dict[str, Any]], Dict[str, torch.Tensor]], for_loss: bool = False) -> Dict[str, torch.Tensor]:
+        """
+        `src` and `tgt` are either lists of records or their already encoded form (see `encode`).
+        Passing encoded tensors skips all translation work, which is what the Trainer does between epochs.
 
-        # Concatenate all embeddings along the feature dimension
-        combined_src_embedded = torch.cat(src_embeddings, dim=-1)  # Shape: (batch_size, seq_len, total_embedding_dim)
-        combined_tgt_embedded = torch.cat(tgt_embeddings, dim=-1)  # Shape: (batch_size, seq_len, total_embedding_dim)
+        Encoded tensors may also be windowed, [batch, seq_len, embedding_dim] (see `EncodedDataset.windows`),
+        in which case every window is its own sequence through the batch_first encoder/decoder.
+        Unwindowed input ([N, embedding_dim]) is a single sequence of N rows.
 
-        # Project concatenated embeddings back to `d_model` size
-        combined_src_embedded = self.concat_projection(combined_src_embedded)  # Shape: (batch_size, seq_len, d_model)
-        combined_tgt_embedded = self.concat_projection(combined_tgt_embedded)  # Shape: (batch_size, seq_len, d_model)
+        Outputs are always [batch, seq_len, ...], one prediction per input position.
+        `for_loss` is for training, see `project_output`.
+
+        The prediction for target row i only sees the source and target rows before i: the decoder input is the
+        target shifted right by one row, starting with the learned `start_row`, under a causal mask.
+        So training never rewards copying the row that is being predicted.
+        """
+        if not isinstance(src, dict):
+            src = self.encode(src)
+        if not isinstance(tgt, dict):
+            tgt = self.encode(tgt)
+        src = {key: tensor if tensor.dim() == 3 else tensor.unsqueeze(0) for key, tensor in src.items()}
+        tgt = {key: tensor if tensor.dim() == 3 else tensor.unsqueeze(0) for key, tensor in tgt.items()}
+
+        with self.autocast():
+            # Embed and add positional encoding
+            combined_src_embedded = self.positional_encoding(self.embed(src))
+            combined_tgt_embedded = self.positional_encoding(self.shift_right(self.embed(tgt)))
+            tgt_mask = nn.Transformer.generate_square_subsequent_mask(combined_tgt_embedded.size(1), device=combined_tgt_embedded.device)
 
-        # Apply positional encoding
-        combined_src_embedded = self.positional_encoding(combined_src_embedded)
-        combined_tgt_embedded = self.positional_encoding(combined_tgt_embedded)
+            # Shared Transformer forward pass
+            memory = self.encoder(combined_src_embedded)
+            output = self.decoder(combined_tgt_embedded, memory, tgt_mask=tgt_mask, tgt_is_causal=True)
+
+            return self.project_output(output, for_loss=for_loss)
+
+    def shift_right(self, embedded: torch.Tensor) -> torch.Tensor:
+        """ [batch, seq_len, d_model] target embeddings -> decoder input: `start_row`, then every row but the last. """
+        start = self.start_row.to(embedded.dtype).expand(embedded.size(0), 1, -1)
+        # Cut after the cat rather than slicing `embedded`, so the length stays the input's (export keeps it dynamic)
+        return torch.cat([start, embedded], dim=1)[:, :embedded.size(1)]
+
+    def packed(self, name: str, parameters: List[torch.Tensor], pack) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        The (weight, bias) built by `pack()` for a fused layer. With autograd off they are cached until one of
+        `parameters` is changed or moved, otherwise (training, tracing) rebuilt every call so gradients reach every key.
+        """
+        if torch.is_grad_enabled() or torch.compiler.is_compiling():
+            return pack()
+        version = tuple((parameter.data_ptr(), parameter._version) for parameter in parameters)
+        cached = self._packed_cache.get(name)
+        if cached is None or cached[0] != version:
+            cached = (version, pack())
+            self._packed_cache[name] = cached
+        return cached[1]
+
+    def embed(self, encoded: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """ Per key embeddings, concatenated and projected to [batch, seq_len, d_model]. No positional encoding. """
+        keys = self.config.layers.keys()
+        if self.fused:
+            # One block diagonal linear over the concatenated inputs, same result as a linear per key then concat
+            weight, bias = self.packed("embeddings", [parameter for key in keys for parameter in self.embeddings[key].parameters()], lambda: (
+                torch.block_diag(*[self.embeddings[key].weight for key in keys]),
+                torch.cat([self.embeddings[key].bias for key in keys]),
+            ))
+            combined_embedded = F.linear(torch.cat([encoded[key] for key in keys], dim=-1), weight, bias)
+        else:
+            # Get the embeddings for each key and concatenate along the feature dimension
+            embeddings = [self.embeddings[key](encoded[key]) for key in keys]
+            combined_embedded = torch.cat(embeddings, dim=-1)  # Shape: (batch_size, seq_len, total_embedding_dim)
+        # Project concatenated embeddings back to `d_model` size
+        return self.concat_projection(combined_embedded)  # Shape: (batch_size, seq_len, d_model)
 
-        # Shared Transformer forward pass
-        memory = self.encoder(combined_src_embedded)
-        output = self.decoder(combined_tgt_embedded, memory)
+    def project_output(self, output: torch.Tensor, for_loss: bool = False) -> Dict[str, torch.Tensor]:
+        """
+        Split the decoder output into one prediction tensor per key. Results are always float32.
 
-        # Split the output for each layer
+        With `for_loss`, heads that compute their own training loss (sampled/adaptive category heads, anything with
+        a `loss` method) return the decoder output itself, their full logits are never needed for training.
+        """
+        keys = list(self.config.layers.keys())
         results = {}
-        for key in self.config.layers.keys():
-            layer_output = self.output_layers[key](output)
+        if self.fused and self.packed_keys:
+            # All linear heads as one linear, split back into per key views by column offsets
+            weight, bias = self.packed("output_layers", [parameter for key in self.packed_keys for parameter in self.output_layers[key].parameters()], lambda: (
+                torch.cat([self.output_layers[key].weight for key in self.packed_keys]),
+                torch.cat([self.output_layers[key].bias for key in self.packed_keys]),
+            ))
+            # Heads may run in bfloat16 under autocast, losses and denormalization stay in float32
+            combined = F.linear(output, weight, bias).float() * self.output_normalizer
+            results.update(zip(self.packed_keys, torch.split(combined, self.output_sizes, dim=-1)))
+        for key in keys:
+            if key in results:
+                continue
+            if for_loss and hasattr(self.output_layers[key], "loss"):
+                # See `Trainer.compute_loss`
+                results[key] = output.float()
+                continue
+            # Heads may run in bfloat16 under autocast, losses and denormalization stay in float32
+            layer_output = self.output_layers[key](output).float()
             if self.config.layers[key].datatype in ['int', 'float']:
                 layer_output = layer_output * self.config.layers[key].normalizer
             results[key] = layer_output
+        return {key: results[key] for key in keys}
 
-        return results
+    def sample_encoded(self, output: Dict[str, torch.Tensor], temperature: float = 0.0, noise_scale: float = 0.1) -> Dict[str, torch.Tensor]:
+        """
+        Turn model output back into encoded input form ([..., embedding_dim] per key), one row per output position.
+        This is what lets generated rows be fed back into the model without decoding them.
+
+        With `temperature <= 0` every head takes its most likely value. Otherwise category, boolean and string heads
+        sample from softmax(logits / temperature), and int, float and date heads get gaussian noise with a
+        standard deviation of `temperature * noise_scale` (times the key's normalizer for int/float).
+        """
+        encoded = {}
+        for key, tensor in output.items():
+            layer = self.config.layers[key]
+            if layer.datatype in ["category", "boolean", "string"]:
+                logits = tensor.float()
+                if layer.datatype == "string":
+                    logits = logits.reshape(*tensor.shape[:-1], layer.max_len, layer.total_characters)
+                if temperature > 0:
+                    probabilities = F.softmax(logits / temperature, dim=-1)
+                    indices = torch.multinomial(probabilities.reshape(-1, probabilities.size(-1)), 1).view(probabilities.shape[:-1])
+                else:
+                    indices = torch.argmax(logits, dim=-1)
+                # Strings keep [..., max_len], the single value types become [..., 1]
+                encoded[key] = indices.float() if layer.datatype == "string" else indices.float().unsqueeze(-1)
+            else:
+                values = tensor.float()
+                if temperature > 0:
+                    scale = temperature * noise_scale * (layer.normalizer if layer.datatype in ["int", "float"] else 1.0)
+                    values = values + torch.randn_like(values) * scale
+                if layer.datatype == "int":
+                    values = torch.round(values)
+                encoded[key] = values
+        return encoded
 
     def entropy(self, probabilities: torch.Tensor) -> torch.Tensor:
         """ Calculate the entropy of the probability distribution. """
@@ -150,18 +381,17 @@ class DataTransformerModel(nn.Module):
             if layer.datatype == "string":
                 # print("string")
                 # Reshape for view
-                reshaped_tensor = tensor.view(tensor.size(0), layer.max_len, -1, layer.total_characters)
+                reshaped_tensor = tensor.reshape(-1, layer.max_len, layer.total_characters)
                 probabilities = F.softmax(reshaped_tensor, dim=-1)
-                averaged_probabilities = probabilities.mean(dim=2)
-                predicted_indices = torch.argmax(averaged_probabilities, dim=-1) # will be of shape [batch, max_len],
-                # Mode of results across the batch
+                predicted_indices = torch.argmax(probabilities, dim=-1) # will be of shape [rows, max_len],
+                # Mode of results across the rows
                 mode_result, _ = torch.mode(predicted_indices, dim=0)
                 decoded = layer.decode(mode_result.tolist())
                 decoded_output[key] = decoded
                 original_output[key] = decoded
 
             elif layer.datatype == "boolean":
-                probabilities = F.softmax(tensor, dim=-1)
+                probabilities = F.softmax(tensor.reshape(-1, 2), dim=-1)
                 # Calculate entropy
                 entropy = self.entropy(probabilities)
                 # Calculate the average entropy across the batch
@@ -172,13 +402,13 @@ class DataTransformerModel(nn.Module):
                 if average_entropy < entropy_threshold:
                     # If entropy is low, rely on the highest probability
                     predicted_classes = torch.argmax(probabilities, dim=-1)
-                    final_result = predicted_classes.bool().mean().item() >= 0.5.item()
+                    final_result = predicted_classes.float().mean().item() >= 0.5
                 else:
                     # If entropy is high, fallback strategy (e.g., averaging the probabilities)
                     averaged_probabilities = probabilities.mean(dim=0)
-                    final_result = averaged_probabilities[0][1] > averaged_probabilities[0][0].item()
-                decoded_output[key] = final_result.item()
-                original_output[key] = final_result.item()
+                    final_result = bool(averaged_probabilities[1] > averaged_probabilities[0])
+                decoded_output[key] = final_result
+                original_output[key] = final_result
             elif layer.datatype == "int":
                 # print("int")
                 decoded_output[key] = layer.decode(tensor)
@@ -189,36 +419,86 @@ class DataTransformerModel(nn.Module):
                 original_output[key] = layer.decode(tensor)
             elif layer.datatype == "category":
                 # print("category")
-                # Apply softmax to convert logits to probabilities
-                probabilities = F.softmax(tensor, dim=-1)
-                # Step 2: Use argmax to select the index with the highest probability
-                selected_indices = torch.argmax(probabilities, dim=-1)
-                # Calculate the mode (most frequent value) along the column (axis=0)
-                right_enum, _ = torch.mode(selected_indices, dim=0)
-                right_enum_list = right_enum.tolist()
-                counts = {}
-                for index in right_enum_list:
-                    if index in counts:
-                        counts[index] += 1
-                    else:
-                        counts[index] = 1
-                max_count = 0
-                right_enum_index = right_enum_list[0]  
-                for index, count in counts.items():
-                    if count > max_count:
-                        max_count = count
-                        right_enum_index = index
-                # print(f"Correct enum is {right_enum_index}")
+                # Select the index with the highest logit, for every row
+                selected_indices = torch.argmax(tensor, dim=-1).reshape(-1)
+                # The most frequent category across the rows
+                right_enum_index = int(torch.mode(selected_indices).values)
                 decoded_output[key] = layer.decode(right_enum_index)  # Likelihood for each category
                 original_output[key] = layer.decode(right_enum_index)  # Likelihood for each category
             elif layer.datatype == "date":
-                decoded_output[key] = layer.decode(tensor)
-                original_output[key] = stringdate(layer.decode(tensor), layer.date_pattern)
+                decoded_date = layer.decode(tensor)
+                decoded_output[key] = decoded_date
+                original_output[key] = stringdate(decoded_date, layer.date_pattern)
             else:
                 print("UNCAUGHT DATATYPE")
                 decoded_output[key] = layer.decode(tensor.squeeze(0))
                 original_output[key] = layer.decode(tensor.squeeze(0))
 
         return {"original":original_output, "model":decoded_output}
-    
-    
+
+    @torch.no_grad()
+    def predict(self, output: Dict[str, torch.Tensor], records: bool = False) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Bulk decoding of every output position, one prediction per row (no voting across rows).
+
+        Argmax and denormalization run on the output tensors for all rows at once, and the result is columnar:
+        int/float -> float tensor [N], boolean -> bool tensor [N], date -> long tensor [N, 3] (year, month, day),
+        category/string -> list of N values.
+
+        Set `records` to get the rows as dicts instead (see `to_records`).
+        """
+        # Greedy encoded form: argmax indices and denormalized numbers, still on the model device
+        columns = self.decode_columns(self.sample_encoded(output))
+        if records:
+            return self.to_records(columns)
+        return columns
+
+    def top_k(self, output: Dict[str, torch.Tensor], k: int = 5) -> Dict[str, Any]:
+        """
+        The `k` most likely values of every category key, for every output position.
+        Returns {key: (values, probabilities)}, values as N lists of k values and probabilities as a [N, k] tensor.
+        Probabilities come from the full softmax, so the ranking is exact whichever head the key was trained with.
+        """
+        results = {}
+        for key, tensor in output.items():
+            layer = self.config.layers[key]
+            if layer.datatype != "category":
+                continue
+            probabilities = F.softmax(tensor.float().reshape(-1, tensor.size(-1)), dim=-1)
+            top_probabilities, indices = torch.topk(probabilities, min(k, probabilities.size(-1)), dim=-1)
+            values = [[layer.translator.reverse_category_map[index] for index in row] for row in indices.tolist()]
+            results[key] = (values, top_probabilities)
+        return results
+
+    def decode_columns(self, encoded: Dict[str, torch.Tensor]) -> Dict[str, Any]:
+        """ Encoded rows ({key: [..., embedding_dim]}, see `sample_encoded`) to `predict` columns. """
+        columns = {}
+        for key, tensor in encoded.items():
+            layer = self.config.layers[key]
+            rows = tensor.reshape(-1, tensor.size(-1))
+            if layer.datatype in ["int", "float"]:
+                columns[key] = rows[:, 0]
+            elif layer.datatype == "boolean":
+                columns[key] = rows[:, 0] >= 0.5
+            elif layer.datatype == "date":
+                columns[key] = layer.translator.decode_date_components(rows)
+            else:
+                columns[key] = layer.decode_batch(rows)
+        return columns
+
+    def to_records(self, columns: Dict[str, Any], original: bool = True) -> List[Dict[str, Any]]:
+        """
+        Converts `predict` columns into a list of row dicts.
+        With `original` dates are formatted with their date pattern, otherwise they are {"year", "month", "day"}.
+        """
+        values = {}
+        for key, column in columns.items():
+            layer = self.config.layers[key]
+            column = column.tolist() if isinstance(column, torch.Tensor) else column
+            if layer.datatype == "date":
+                column = [{"year": y, "month": m, "day": d} for y, m, d in column]
+                if original:
+                    column = [stringdate(value, layer.date_pattern) for value in column]
+            values[key] = column
+        size = len(next(iter(values.values()))) if values else 0
+        return [{key: values[key][i] for key in values} for i in range(size)]
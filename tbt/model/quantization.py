@@ -0,0 +1,151 @@
+import copy
+import io
+import time
+import torch
+import torch.nn as nn
+from typing import Dict, Any, List, Tuple
+from torch.ao.quantization import quantize_dynamic, default_dynamic_qconfig
+
+
+def quantizable_linears(model) -> List[str]:
+    """
+    Names of the `nn.Linear` modules that carry most of the compute: the transformer feed-forward layers,
+    `concat_projection` and the per-key output heads. The small per-key input embeddings and the
+    attention projections are left in float32.
+    """
+    names = []
+    for name, module in model.named_modules():
+        if type(module) is not nn.Linear:
+            continue
+        if name.endswith(".linear1") or name.endswith(".linear2") or name == "concat_projection" or name.startswith("output_layers."):
+            names.append(name)
+    return names
+
+
+def quantize(model):
+    """
+    Returns an int8 dynamically quantized copy of `model` for CPU inference. Weights of the layers from
+    `quantizable_linears` are stored as int8, activations are quantized on the fly per batch.
+    The original model is left untouched.
+    """
+    quantized = copy.deepcopy(model).to("cpu").eval()
+    quantized.device = torch.device("cpu")
+    quantized.precision = "fp32"
+    # Quantized heads have no float weights to pack, run them one by one
+    quantized.fused = False
+    qconfig_spec = {name: default_dynamic_qconfig for name in quantizable_linears(quantized)}
+    quantized = quantize_dynamic(quantized, qconfig_spec, dtype=torch.qint8)
+    for layer in quantized.encoder.layers:
+        # The fused encoder fast path reads `linear1.weight` as a float tensor, which packed int8 linears don't have.
+        # This flag is only consulted by that check, so the layer falls back to the regular module by module path.
+        layer.activation_relu_or_gelu = False
+    return quantized
+
+
+def model_size(model) -> int:
+    """ Serialized state dict size in bytes. """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+@torch.no_grad()
+def latency(model, source, target, runs: int = 5) -> float:
+    """ Median forward time in milliseconds for already encoded inputs. """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model(source, target)
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def _encoded_windows(model, source, target, window_size):
+    encoded_source = model.encode(source)
+    encoded_target = model.encode(target)
+    if window_size is None:
+        return encoded_source, encoded_target
+    # Drop the ragged tail so every window has the same length
+    rows = (len(source) // window_size) * window_size
+    return (
+        {key: tensor[:rows].view(-1, window_size, tensor.size(-1)) for key, tensor in encoded_source.items()},
+        {key: tensor[:rows].view(-1, window_size, tensor.size(-1)) for key, tensor in encoded_target.items()},
+    )
+
+
+def _key_metrics(layer, expected, reference, candidate) -> Dict[str, float]:
+    """ Accuracy of both models against the expected values, and how often they agree with each other. """
+    if layer.datatype in ["int", "float"]:
+        return {
+            "fp32_mae": (reference - expected).abs().mean().item(),
+            "int8_mae": (candidate - expected).abs().mean().item(),
+            "max_abs_diff": (reference - candidate).abs().max().item(),
+        }
+    if layer.datatype == "date":
+        return {
+            "fp32_exact": (reference == expected).all(dim=-1).float().mean().item(),
+            "int8_exact": (candidate == expected).all(dim=-1).float().mean().item(),
+            "agreement": (reference == candidate).all(dim=-1).float().mean().item(),
+        }
+    if isinstance(reference, torch.Tensor):
+        reference, candidate, expected = reference.tolist(), candidate.tolist(), expected.tolist()
+    size = max(len(expected), 1)
+    return {
+        "fp32_accuracy": sum(r == e for r, e in zip(reference, expected)) / size,
+        "int8_accuracy": sum(c == e for c, e in zip(candidate, expected)) / size,
+        "agreement": sum(r == c for r, c in zip(reference, candidate)) / size,
+    }
+
+
+@torch.no_grad()
+def compare(reference, candidate, source: List[Dict[str, Any]], target: List[Dict[str, Any]], window_size: int = None) -> Dict[str, Any]:
+    """
+    Accuracy comparison of two models (fp32 `reference`, quantized `candidate`) on the same rows.
+    With `window_size` the rows are scored as windows of that length, otherwise as one sequence.
+    """
+    was_training = reference.training
+    reference.eval()
+    candidate.eval()
+    encoded_source, encoded_target = _encoded_windows(reference, source, target, window_size)
+    cpu_source = {key: tensor.cpu() for key, tensor in encoded_source.items()}
+    cpu_target = {key: tensor.cpu() for key, tensor in encoded_target.items()}
+    reference_columns = reference.predict(reference(encoded_source, encoded_target))
+    candidate_columns = candidate.predict(candidate(cpu_source, cpu_target))
+    # Encoded targets are already in the greedy encoded form `predict` decodes from
+    expected_columns = candidate.decode_columns(cpu_target)
+
+    keys = {}
+    for key, layer in reference.config.layers.items():
+        columns = [expected_columns[key], reference_columns[key], candidate_columns[key]]
+        columns = [column.cpu() if isinstance(column, torch.Tensor) else column for column in columns]
+        keys[key] = _key_metrics(layer, *columns)
+
+    report = {
+        "rows": len(expected_columns[next(iter(expected_columns))]),
+        "keys": keys,
+        "latency_ms": {"fp32": latency(reference, encoded_source, encoded_target), "int8": latency(candidate, cpu_source, cpu_target)},
+        "size_bytes": {"fp32": model_size(reference), "int8": model_size(candidate)},
+    }
+    reference.train(was_training)
+    return report
+
+
+def export_quantized(model, source: List[Dict[str, Any]], target: List[Dict[str, Any]], holdout: float = 0.2, window_size: int = None) -> Tuple[Any, Dict[str, Any]]:
+    """
+    One call int8 export: quantizes `model` (see `quantize`) and compares it against the fp32 model on
+    the last `holdout` fraction of the aligned source/target rows.
+
+    Returns (quantized_model, report). The report has per-key accuracy for both models and their agreement,
+    median forward latency and serialized size.
+    """
+    if len(source) != len(target):
+        raise Exception(f"Source to Target mappings must be equal in length. Source is {len(source)} and Taget is {len(target)}")
+    split = len(source) - max(1, int(len(source) * holdout))
+    quantized = quantize(model)
+    report = compare(model, quantized, source[split:], target[split:], window_size=window_size)
+    print(f"Quantized model compared on {report['rows']} held-out rows")
+    print(f"Latency: {report['latency_ms']['fp32']:.2f}ms fp32 -> {report['latency_ms']['int8']:.2f}ms int8")
+    print(f"Size: {report['size_bytes']['fp32'] / 1e6:.2f}MB fp32 -> {report['size_bytes']['int8'] / 1e6:.2f}MB int8")
+    for key, metrics in report["keys"].items():
+        print(f"  {key}: " + ", ".join(f"{name}={value:.4f}" for name, value in metrics.items()))
+    return quantized, report
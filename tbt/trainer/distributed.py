@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader
+from torch.utils.data.distributed import DistributedSampler
+from typing import Dict, Any
+from tbt.config.config import ModelConfig
+from tbt.model.model import DataTransformerModel
+from tbt.dataset.dataset import WindowDataset
+from tbt.checkpoint.checkpoint import snapshot, write_checkpoint, read_checkpoint, load_weights
+
+
+def _worker(rank: int, world_size: int, init_file: str, checkpoint: Dict[str, Any], windows: WindowDataset, options: Dict[str, Any], result_path: str):
+    from tbt.trainer.trainer import Trainer
+
+    # Split the cores between the workers instead of every process using all of them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size)
+    try:
+        config = ModelConfig.from_dict(checkpoint["config"])
+        model = DataTransformerModel(config, **checkpoint["hparams"])
+        load_weights(model, checkpoint)
+        trainer = Trainer(model, config)
+        optimizer = trainer.get_optimizer()
+        if checkpoint["optimizer"] is not None:
+            optimizer.load_state_dict(checkpoint["optimizer"])
+        # DDP all-reduces (averages) gradients during backward, so every rank takes the same optimizer step.
+        # The only buffer is the constant positional encoding, so there is nothing to broadcast.
+        trainer.model = DistributedDataParallel(model, broadcast_buffers=False)
+
+        sampler = DistributedSampler(windows, num_replicas=world_size, rank=rank, shuffle=options["shuffle"])
+        loader = DataLoader(windows, batch_size=options["batch_size"], sampler=sampler)
+        scaler = trainer.get_scaler()
+        trainer.model.train()
+        epochs = options["epochs"]
+        for epoch in range(epochs):
+            sampler.set_epoch(epoch)
+            total_loss = torch.zeros(1)
+            for source, target, loss_targets in loader:
+                total_loss += trainer.train_step(optimizer, scaler, source, target, loss_targets)
+            dist.all_reduce(total_loss)
+            if rank == 0:
+                print("                                          ", end="\r")
+                print(f"Epoch {epoch+1}/{epochs}, Loss: {total_loss.item()/options['rows']}", end="\r")
+        if rank == 0:
+            write_checkpoint(snapshot(model, optimizer), result_path)
+    finally:
+        dist.destroy_process_group()
+
+
+def train_distributed(trainer, world_size: int, epochs: int, window_size: int, stride: int = None, batch_size: int = 32, shuffle: bool = True):
+    """
+    Data-parallel training on one machine: `world_size` local CPU processes on the gloo backend.
+
+    The windows are sharded across the processes and gradients are all-reduced every step, so each
+    optimizer step covers `world_size * batch_size` windows. The processes meet through a temporary
+    file, no external service is needed. When done the trained weights and optimizer state are loaded
+    back into `trainer`.
+
+    Uses the "spawn" start method, so scripts calling this need an `if __name__ == "__main__":` guard.
+    """
+    dataset = trainer.get_dataset()
+    windows = WindowDataset(dataset, window_size, stride)
+    checkpoint = snapshot(trainer.model, trainer.get_optimizer())
+    options = {"epochs": epochs, "batch_size": batch_size, "shuffle": shuffle, "rows": len(dataset)}
+    workdir = tempfile.mkdtemp(prefix="tbt-distributed-")
+    try:
+        init_file = os.path.join(workdir, "init")
+        result_path = os.path.join(workdir, "result.pt")
+        mp.spawn(_worker, args=(world_size, init_file, checkpoint, windows, options, result_path), nprocs=world_size, join=True)
+        result = read_checkpoint(result_path)
+        load_weights(trainer.model, result)
+        trainer.get_optimizer().load_state_dict(result["optimizer"])
+        trainer.epoch += epochs
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("Training complete.                                                      ")
@@ -4,106 +4,233 @@ import torch.optim as optim
 import torch.nn.functional as F
 from torch.utils.data import DataLoader, Dataset
 from typing import List, Dict, Any
+from tbt.dataset.dataset import EncodedDataset, WindowDataset, loss_target
+from tbt.dataset.binary import load_dataset
+from tbt.checkpoint.checkpoint import CheckpointWriter, save_checkpoint, read_checkpoint, load_weights
 
 
 
 
 class Trainer:
-    def __init__(self, model, config):
+    def __init__(self, model, config, precision=None):
+        """
+        `precision` ("fp32" or "bf16") overrides the model's precision for training and inference.
+        """
         self.model = model.to(self.get_device())
+        if precision is not None:
+            self.model.precision = precision
         self.config = config
         self.source = []
         self.target = []
+        self.dataset = None
+        self.optimizer = None
+        self.epoch = 0
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
     def get_device(self):
         return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
     def add_data(self, source, target):
+        """
+        Sets the training data and encodes it once into an `EncodedDataset`.
+        """
         self.source = source
         self.target = target
+        self.dataset = EncodedDataset(source, target, self.model)
 
-    def train(self, epochs=10):
+    def load_data(self, path, cache=True):
+        """
+        Loads a JSON/JSONL dataset file and encodes it, see `tbt.dataset.binary.load_dataset`.
+        With `cache` the encoded columns are written next to the file on the first load and memory-mapped after that.
+        """
+        self.dataset = load_dataset(path, self.model, cache=cache)
+        self.source = self.dataset.raw_source
+        self.target = self.dataset.raw_target
+
+    def get_dataset(self):
+        """
+        Returns the encoded training data, re-encoding it if `source`/`target` were swapped out
+        or the `ModelConfig` changed since it was built.
+        """
+        if self.dataset is None or not self.dataset.is_valid(self.source, self.target, self.config):
+            self.dataset = EncodedDataset(self.source, self.target, self.model)
+        return self.dataset
+
+    def get_optimizer(self):
+        """ The optimizer is kept across `train` calls (and checkpoints) so training can be resumed. """
+        if self.optimizer is None:
+            self.optimizer = optim.Adam(self.model.parameters(), lr=0.001)
+        return self.optimizer
+
+    def get_scaler(self):
+        """
+        Gradient scaling only matters for float16, which isn't used. bfloat16 has float32's range,
+        so the scaler is a pass-through kept for the `train_step` interface.
+        """
+        return torch.amp.GradScaler(self.device.type, enabled=False)
+
+    def save_checkpoint(self, path):
+        """ Saves the model, its ModelConfig and the optimizer state to `path`. """
+        save_checkpoint(path, self.model, self.get_optimizer(), {"epoch": self.epoch})
+
+    def load_checkpoint(self, path):
+        """ Restores model weights and optimizer state saved by `save_checkpoint` to resume training. """
+        checkpoint = read_checkpoint(path)
+        load_weights(self.model, checkpoint)
+        if checkpoint["optimizer"] is not None:
+            self.get_optimizer().load_state_dict(checkpoint["optimizer"])
+        self.epoch = checkpoint.get("epoch", 0)
+
+    def train(self, epochs=10, window_size=None, stride=None, batch_size=None, num_workers=0, shuffle=True, checkpoint_path=None, checkpoint_every=1):
+        """
+        Trains the model on the loaded data.
+
+        By default the whole dataset is a single sequence. Set `window_size` to instead cut the aligned
+        source/target rows into windows of that many rows (every `stride` rows, default no overlap)
+        and train on all of them as one batch. Cost then grows linearly with the number of rows,
+        and the dataset can be longer than the model's `max_len`.
+
+        Set `batch_size` (with `window_size`) for minibatch training: windows are loaded by a `DataLoader`,
+        shuffled if `shuffle`, prefetched by `num_workers` worker processes, and each batch is its own
+        optimizer step. Memory is then bounded by the batch size instead of the dataset size.
+        """
         if len(self.source) != len(self.target):
             raise Exception(f"Source to Target mappings must be equal in length. Source is {len(self.source)} and Taget is {len(self.target)}")
+        dataset = self.get_dataset()
+        if batch_size is not None:
+            if window_size is None:
+                raise ValueError("Minibatch training needs a window_size.")
+            batches = DataLoader(
+                WindowDataset(dataset, window_size, stride),
+                batch_size=batch_size,
+                shuffle=shuffle,
+                num_workers=num_workers,
+                persistent_workers=num_workers > 0,
+                pin_memory=self.device.type == "cuda",
+            )
+        elif window_size is not None:
+            batches = [dataset.windows(window_size, stride)]
+        else:
+            # The whole dataset as a single sequence
+            batches = [(
+                {key: tensor.unsqueeze(0) for key, tensor in dataset.source.items()},
+                {key: tensor.unsqueeze(0) for key, tensor in dataset.target.items()},
+                {key: tensor.unsqueeze(0) for key, tensor in dataset.loss_target.items()},
+            )]
+
+        optimizer = self.get_optimizer()
+        scaler = self.get_scaler()
+        writer = CheckpointWriter() if checkpoint_path is not None else None
+        self.model.train()
+        try:
+            for epoch in range(epochs):
+                total_loss = 0
+                for source, target, loss_targets in batches:
+                    total_loss += self.train_step(optimizer, scaler, source, target, loss_targets)
+                self.epoch += 1
+                print("                                          ", end="\r")
+                print(f"Epoch {epoch+1}/{epochs}, Loss: {total_loss/len(self.source)}", end="\r")
+                if writer is not None and (epoch + 1) % checkpoint_every == 0:
+                    writer.save(checkpoint_path, self.model, optimizer, {"epoch": self.epoch})
+        finally:
+            if writer is not None:
+                writer.close()
+        print("Training complete.                                                      ")
 
-        optimizer = optim.Adam(self.model.parameters(), lr=0.001)
-        scaler = torch.cuda.amp.GradScaler() # Use Automatic Mixed Precision for efficiency
+    def train_stream(self, stream, epochs=1, batch_size=32, num_workers=0, checkpoint_path=None, checkpoint_every=1):
+        """
+        Minibatch training on a `StreamDataset` (see `tbt.dataset.stream`), for data that doesn't fit in memory.
+        The file is read again every epoch, `num_workers` DataLoader workers split its chunks between them.
+        The reported loss is the mean per batch, the number of rows isn't known up front.
+        """
+        batches = DataLoader(
+            stream,
+            batch_size=batch_size,
+            num_workers=num_workers,
+            persistent_workers=num_workers > 0,
+            pin_memory=self.device.type == "cuda",
+        )
+        optimizer = self.get_optimizer()
+        scaler = self.get_scaler()
+        writer = CheckpointWriter() if checkpoint_path is not None else None
         self.model.train()
-        for epoch in range(epochs):
-            total_loss = 0
-            optimizer.zero_grad()
-            output = self.model(self.source, self.target)
-            loss = 0
-
-            for key in output:
-                datatype = self.config.layers[key].datatype
-                target_tensor = self.get_target_tensor(self.target, key, datatype, self.config.layers[key]).to(self.device)
-                loss += self.compute_loss(output[key], target_tensor, datatype, self.config.layers[key])
-
-            # Backward pass using the scaler
-            scaler.scale(loss).backward()
-            # Optimizer step using the scaler
-            scaler.step(optimizer)
-            # Update the scaler for the next iteration
-            scaler.update()
-
-            total_loss += loss.item()
-            print("                                          ", end="\r")
-            print(f"Epoch {epoch+1}/{epochs}, Loss: {total_loss/len(self.source)}", end="\r")
+        try:
+            for epoch in range(epochs):
+                total_loss = 0
+                steps = 0
+                for source, target, loss_targets in batches:
+                    total_loss += self.train_step(optimizer, scaler, source, target, loss_targets)
+                    steps += 1
+                self.epoch += 1
+                print("                                          ", end="\r")
+                print(f"Epoch {epoch+1}/{epochs}, Loss: {total_loss/max(steps, 1)}", end="\r")
+                if writer is not None and (epoch + 1) % checkpoint_every == 0:
+                    writer.save(checkpoint_path, self.model, optimizer, {"epoch": self.epoch})
+        finally:
+            if writer is not None:
+                writer.close()
         print("Training complete.                                                      ")
+
+    def train_distributed(self, world_size, epochs=10, window_size=64, stride=None, batch_size=32, shuffle=True):
+        """
+        Minibatch training split across `world_size` local CPU processes (see `tbt.trainer.distributed`).
+        """
+        from tbt.trainer.distributed import train_distributed
+        train_distributed(self, world_size, epochs, window_size, stride=stride, batch_size=batch_size, shuffle=shuffle)
+
+    def train_step(self, optimizer, scaler, source, target, loss_targets):
+        """
+        One optimizer step on a batch of encoded windows ({key: [batch, seq_len, ...]}). Returns the loss.
+        """
+        source = {key: tensor.to(self.device, non_blocking=True) for key, tensor in source.items()}
+        target = {key: tensor.to(self.device, non_blocking=True) for key, tensor in target.items()}
+        optimizer.zero_grad()
+        # Inputs are already encoded, so every step is pure tensor math
+        output = self.model(source, target, for_loss=True)
+        # Under DistributedDataParallel the heads live on the wrapped module
+        heads = getattr(self.model, "module", self.model).output_layers
+        loss = 0
+
+        for key in output:
+            datatype = self.config.layers[key].datatype
+            loss += self.compute_loss(output[key], loss_targets[key], datatype, self.config.layers[key], head=heads[key])
+
+        # Backward pass using the scaler
+        scaler.scale(loss).backward()
+        # Optimizer step using the scaler
+        scaler.step(optimizer)
+        # Update the scaler for the next iteration
+        scaler.update()
+        return loss.item()
+
     def get_target_tensor(self, target, key, datatype, layer):
-        if datatype == 'category':
-            # Convert string category to index
-            # print('category')
-            target_tensor = torch.stack([self.config.layers[key].encode(target[i][key]).to(self.device) for i in range(len(target))], dim=0)
-            # print(target_tensor.size())
-            target_tensor = target_tensor.view(-1)
-            target_tensor = target_tensor.repeat(len(target)).view(-1)
-            # target_tensor = torch.tensor([self.config.layers[key].encode(target[i][key]).item() for i in range(len(target))], dtype=torch.long)
-        elif datatype == 'string':
-            # Convert each string in the batch to a tensor of indices
-            # print('string')
-            target_tensor = torch.stack([self.config.layers[key].encode(target[i][key]).to(self.device) for i in range(len(target))], dim=0)
-            target_tensor = target_tensor.view(-1)
-        elif datatype == 'date':
-            # print('date')
-            # Convert each date string in the batch to a normalized tensor of [year, month, day]
-            target_tensor = torch.stack([self.config.layers[key].encode(target[i][key], layer.date_pattern).to(self.device) for i in range(len(target))], dim=0)
-        elif datatype in ['int', 'float', 'boolean']:
-            # Handle numeric and boolean types
-            target_tensor = torch.tensor([target[i][key] for i in range(len(target))], dtype=torch.float).to(self.device)
-        else:
-            raise ValueError(f"Unsupported datatype: {datatype}")
-        return target_tensor
+        values = [target[i][key] for i in range(len(target))]
+        return loss_target(layer.encode_column(values), datatype).to(self.device)
 
-    def compute_loss(self, output, target, datatype, layer):
-        if datatype == "boolean":
-            output = output.view(-1, 2)
-            target = target.repeat_interleave(len(target)).long().to(self.device)  # Adjust target size to match output
-            loss = F.cross_entropy(output, target)
+    def compute_loss(self, output, target, datatype, layer, head=None):
+        """
+        Loss for one output head. `output` is [batch, seq_len, ...] and each position is compared
+        with the target row at the same position, so memory and compute are linear in the number of rows.
+
+        Heads with their own `loss` (sampled/adaptive softmax) get the decoder output (see `project_output`'s `for_loss`).
+        """
+        target = target.to(self.device, non_blocking=True)
+        if head is not None and hasattr(head, "loss"):
+            loss = head.loss(output, target)
+        elif datatype == "boolean":
+            loss = F.cross_entropy(output.reshape(-1, 2), target.reshape(-1).long())
         elif datatype == "int" or datatype == "float":
-            target = target.unsqueeze(1).expand(-1, target.size(0)).to(self.device)
-            loss = F.mse_loss(output.squeeze(-1), target)
-            # loss = F.mse_loss(output.view_as(target), target)
+            loss = F.mse_loss(output.squeeze(-1), target.view_as(output.squeeze(-1)))
         elif datatype == "category":
-            output = output.view(-1, output.size(-1)).to(self.device)
-            target = target.view(-1).long().to(self.device)
-            loss = F.cross_entropy(output, target)
+            loss = F.cross_entropy(output.reshape(-1, output.size(-1)), target.reshape(-1).long())
         elif datatype == "string":
-            # Adjust target tensor to match output shape
-            batch_size = output.size(0)
-            sequence_length = output.size(0) # batch_size
-            output = output.view(batch_size * sequence_length * layer.max_len, layer.total_characters).to(self.device)
-            # Reshape target to match the number of required predictions
-            target = target.repeat_interleave(batch_size).to(self.device)  # Repeating N times to match the expected N*batch elements
+            output = output.reshape(-1, layer.total_characters)
+            target = target.reshape(-1)
             if output.size(0) != target.size(0):
                 raise ValueError(f"Output and target batch sizes do not match: {output.size(0)} vs {target.size(0)}")
             loss = F.cross_entropy(output, target)
         elif datatype == "date":
-            target = target.unsqueeze(1).expand(target.size(0), target.size(0), target.size(1)).to(self.device)
-            loss = F.mse_loss(output, target.float())
+            loss = F.mse_loss(output, target.view_as(output))
         else:
             raise ValueError(f"Unsupported datatype: {datatype}")
         return loss
-    
\ No newline at end of file
@@ -4,20 +4,30 @@ from typing import Dict, Union, Literal, Any, List
 import datetime
 import re
 import math
-from tbt.translator.utils import get_year_date_month
-    
+import sys
+from tbt.translator.utils import get_year_date_month, parse_date_column
+
+# Code points as native int32, so utf-32 buffers can be viewed as tensors directly
+UTF32 = "utf-32-le" if sys.byteorder == "little" else "utf-32-be"
+
 class Translator:
     def __init__(self, datatype: Literal["float", "int", "date", "string", "category", "boolean"], info: Any = {}):
         if datatype == "float":
             self.encode = self.encode_float
             self.decode = self.decode_float
+            self.encode_batch = self.encode_float_batch
+            self.decode_batch = self.decode_float_batch
         elif datatype == "int":
             self.encode = self.encode_int_as_float
             self.decode = self.decode_int_from_float
+            self.encode_batch = self.encode_int_as_float_batch
+            self.decode_batch = self.decode_int_from_float_batch
         elif datatype == "date":
             # Info will contain "date_pattern"
             self.encode = self.encode_date
             self.decode = self.decode_date
+            self.encode_batch = self.encode_date_batch
+            self.decode_batch = self.decode_date_batch
         elif datatype == "string":
             self.character_set = info.get("character_set", [])
             self.reserved_value = info.get("reserved_value", "\u0000")
@@ -30,38 +40,54 @@ class Translator:
             self.total_characters = len(self.distinct_characters)
             self.char_to_idx = {char: i for i, char in enumerate(self.distinct_characters)}
             self.idx_to_char = {i: char for char, i in self.char_to_idx.items()}
+            self._build_string_tables()
             max_len = info.get("max_len", 10)
             self.encode = lambda value: self.encode_string(value, max_len=max_len)
             self.decode = self.decode_string
+            self.encode_batch = lambda values: self.encode_string_batch(values, max_len=max_len)
+            self.decode_batch = self.decode_string_batch
         elif datatype == "category":
             if "values" in info:
                 self.category_map, self.reverse_category_map = self._automap_categories(info["values"])
                 self.encode = lambda value: self.encode_category(value, self.category_map)
                 self.decode = lambda tensor: self.decode_category(tensor, self.reverse_category_map)
+                self.encode_batch = lambda values: self.encode_category_batch(values, self.category_map)
+                self.decode_batch = lambda tensor: self.decode_category_batch(tensor, self.reverse_category_map)
             else:
                 raise ValueError("Missing 'categories' in info for category datatype")
         elif datatype == "boolean":
             self.encode = self.encode_boolean_as_float
             self.decode = self.decode_boolean_from_float
+            self.encode_batch = self.encode_boolean_as_float_batch
+            self.decode_batch = self.decode_boolean_from_float_batch
         self.info = info
     
-    def _automap_categories(self, categories: List[str]) -> Union[Dict[str, int], Dict[int, str]]:
+    def _build_string_tables(self):
+        """
+        Lookup tables between unicode code points and character indices, used by the batch string translators.
+        `code_to_idx[code point]` is the character index (-1 outside the character set), `idx_to_code[index]` the reverse.
+        """
+        codes = [ord(char) for char in self.distinct_characters if len(char) == 1]
+        self.code_to_idx = torch.full((max(codes, default=0) + 1,), -1, dtype=torch.long)
+        self.idx_to_code = torch.zeros(self.total_characters, dtype=torch.int32)
+        for char, idx in self.char_to_idx.items():
+            if len(char) == 1:
+                self.code_to_idx[ord(char)] = idx
+                self.idx_to_code[idx] = ord(char)
+        self.reserved_idx = self.char_to_idx.get(self.reserved_value, 0)
+        self.reserved_code = ord(self.reserved_value) if len(self.reserved_value) == 1 else -1
+
+    def _automap_categories(self, categories: List[str]) -> Union[Dict[str, int], List[str]]:
+        # Hash map one way and a plain list the other, both directions are O(1) however many values there are
         category_map = {category: i for i, category in enumerate(categories)}
-        reverse_category_map = {i: category for category, i in category_map.items()}
+        reverse_category_map = list(categories)
         return category_map, reverse_category_map
 
     RESERVED_PATTERN = "\u0000"  # Null character for reserved padding
 
     def encode_string(self, value: str, max_len: int = 10) -> torch.Tensor:
-        # Remove the reserved characters from input if any
-        clean_value = value.replace(self.reserved_value, "")
-        # Truncate the string to max_len if necessary
-        truncated_value = clean_value[:max_len]
-        # Pad the string with the reserved value if it's shorter than max_len
-        padded_value = truncated_value + self.reserved_value * (max_len - len(truncated_value))
-        # Convert the string to indices based on the character set
-        encoded_indices = [self.char_to_idx[char] for char in padded_value]
-        return torch.tensor(encoded_indices, dtype=torch.long)
+        # Reserved characters are removed, then the string is truncated or padded with the reserved value to max_len
+        return self.encode_string_batch([value], max_len=max_len)[0]
     
     def encode_int_as_float(self, value: int) -> torch.Tensor:
         return torch.tensor([float(value)], dtype=torch.float)
@@ -72,7 +98,7 @@ class Translator:
     def encode_boolean_as_float(self, value: bool) -> torch.Tensor:
         return torch.tensor([1.0 if value else 0.0], dtype=torch.float)
     
-    def encode_date(self, value: Union[str, datetime.date], date_pattern: str) -> torch.Tensor:
+    def encode_date(self, value: Union[str, datetime.date, Dict[str, int]], date_pattern: str) -> torch.Tensor:
         # If the input is a string, extract year, month, and day manually
         ## Need to patch for removing `/` and use date_pattern supplied
         if isinstance(value, str):
@@ -85,6 +111,9 @@ class Translator:
             month = date_obj['month']
             day = date_obj['day']            
             # month, day, year = map(int, match.groups())
+        elif isinstance(value, dict):
+            # Already split into {"year", "month", "day"}, as returned by decode_date
+            year, month, day = value['year'], value['month'], value['day']
         else:
             # If the input is a datetime.date object, extract its components
             year, month, day = value.year, value.month, value.day
@@ -108,24 +137,9 @@ class Translator:
     def encode_category(self, value: str, category_map: Dict[str, int]) -> torch.Tensor:
         return torch.tensor([float(category_map[value])], dtype=torch.float)
     
-    def decode_string(self, tensor: torch.Tensor) -> str:
-        # Convert indices back to characters
-        available_indexes = []
-        for idx in tensor:
-            try:
-                recommendation = self.idx_to_char[int(idx)]
-                available_indexes.append(recommendation)
-            except:
-                available_indexes.append(self.char_to_idx(self.reserved_value))
-                print("Bad parse on strings...")
-                continue
-
-        # Join the characters and strip any trailing reserved values
-        output_string = ""
-        for avi in available_indexes:
-            if avi != self.reserved_value:
-                output_string=output_string+avi
-        return output_string
+    def decode_string(self, tensor: Union[torch.Tensor, List[int]]) -> str:
+        # Convert indices back to characters, dropping reserved values
+        return self.decode_string_batch(torch.as_tensor(tensor).reshape(1, -1))[0]
 
     
     def decode_int_from_float(self, tensor: torch.Tensor, normalization_factor: float = 1.0) -> int:
@@ -138,25 +152,11 @@ class Translator:
         return bool(torch.sigmoid(tensor).item() >= 0.5)
     
     def decode_date(self, tensor: torch.Tensor) -> str:
-        decoded_dates = []
-        
-        for batch in tensor:
-            for date_tensor in batch:
-                # Extract and denormalize each component
-                year = int(date_tensor[0].item() * 1000)  # Assuming normalization to [-1, 1] range
-                month = int((date_tensor[1].item() * 11) + 1)  # Map to [1, 12]
-                day = int((date_tensor[2].item() * 30) + 1)  # Map to [1, 31]
-
-                # Clip the month and day to ensure they are within valid ranges
-                month = max(1, min(12, month))
-                day = max(1, min(31, day))
-
-                # Construct the date string
-                # decoded_date = f"{year:04d}-{month:02d}-{day:02d}"
-                decoded_data = {"year":year,"month":month,"day":day}
-                decoded_dates.append(decoded_data)
-        result = self.pick_most_frequent_date(decoded_dates)
-        return result
+        # Denormalize every row at once, same inverse as `decode_date_batch`
+        components = self.decode_date_components(tensor)
+        # Most frequent year, month, and day across the rows
+        year, month, day = torch.mode(components, dim=0).values.tolist()
+        return {"year": year, "month": month, "day": day}
 
     def pick_most_frequent_date(self,dates: List[str]) -> str:
         years = []
@@ -179,9 +179,109 @@ class Translator:
     
 
     
-    def decode_category(self, value: int, reverse_category_map: Dict[int, str]) -> str:
+    def decode_category(self, value: int, reverse_category_map: List[str]) -> str:
         return reverse_category_map[int(value)]
-    
+
+    # Batch (columnar) translation. Each encoder takes a whole column of values and
+    # returns a single tensor of shape [N, embedding_dim], each decoder does the reverse.
+
+    def encode_string_batch(self, values: List[str], max_len: int = 10) -> torch.Tensor:
+        # The whole column as one utf-32 buffer: one code point per character, no per-character Python work
+        text = "".join(values)
+        codes = torch.frombuffer(bytearray(text.encode(UTF32)), dtype=torch.int32).long() if text else torch.zeros(0, dtype=torch.long)
+        rows = torch.repeat_interleave(torch.arange(len(values)), torch.tensor([len(value) for value in values], dtype=torch.long))
+        # Drop reserved characters, then find each remaining character's position within its string
+        keep = codes != self.reserved_code
+        codes, rows = codes[keep], rows[keep]
+        counts = torch.bincount(rows, minlength=len(values))
+        positions = torch.arange(codes.numel()) - (torch.cumsum(counts, 0) - counts)[rows]
+        keep = positions < max_len
+        codes, rows, positions = codes[keep], rows[keep], positions[keep]
+
+        indices = torch.full_like(codes, -1)
+        known = codes < self.code_to_idx.numel()
+        indices[known] = self.code_to_idx[codes[known]]
+        if (indices < 0).any():
+            unknown = sorted({chr(code) for code in codes[indices < 0].tolist()})
+            raise ValueError(f"Characters {unknown} are not in the character set")
+        encoded = torch.full((len(values), max_len), self.reserved_idx, dtype=torch.long)
+        encoded[rows, positions] = indices
+        return encoded
+
+    def encode_int_as_float_batch(self, values: List[int]) -> torch.Tensor:
+        return torch.tensor(values, dtype=torch.float).view(-1, 1)
+
+    def encode_float_batch(self, values: List[float]) -> torch.Tensor:
+        return torch.tensor(values, dtype=torch.float).view(-1, 1)
+
+    def encode_boolean_as_float_batch(self, values: List[bool]) -> torch.Tensor:
+        return torch.tensor([1.0 if value else 0.0 for value in values], dtype=torch.float).view(-1, 1)
+
+    def encode_category_batch(self, values: List[str], category_map: Dict[str, int]) -> torch.Tensor:
+        return torch.tensor([category_map[value] for value in values], dtype=torch.float).view(-1, 1)
+
+    def encode_date_batch(self, values: List[Union[str, datetime.date, Dict[str, int]]], date_pattern: str) -> torch.Tensor:
+        if all(isinstance(value, str) for value in values):
+            # Plain string columns (the common case) are parsed in one regex pass
+            components = parse_date_column(values, date_pattern).double()
+        else:
+            components = []
+            for value in values:
+                if isinstance(value, str):
+                    date_obj = get_year_date_month(value, date_pattern)
+                    components.append((date_obj['year'], date_obj['month'], date_obj['day']))
+                elif isinstance(value, dict):
+                    components.append((value['year'], value['month'], value['day']))
+                else:
+                    components.append((value.year, value.month, value.day))
+            components = torch.tensor(components, dtype=torch.float64).view(-1, 3)
+        year, month, day = components.unbind(dim=1)
+        # Same normalization as `encode_date`, applied to the whole column at once
+        year_normalized = torch.sign(year) * torch.log1p(year.abs())
+        month_normalized = ((month - 1) / 11.0).clamp(max=11)
+        day_normalized = ((day - 1) / 30.0).clamp(max=31)
+        return torch.stack([year_normalized, month_normalized, day_normalized], dim=1).float()
+
+    def decode_string_batch(self, tensor: torch.Tensor) -> List[str]:
+        indices = (tensor.flatten(1) if tensor.dim() > 1 else tensor.view(-1, 1)).long().cpu()
+        # Reserved values and indices outside the character set are dropped
+        keep = (indices >= 0) & (indices < self.total_characters) & (indices != self.reserved_idx)
+        codes = self.idx_to_code[indices.clamp(0, self.total_characters - 1)][keep]
+        # Copy the code points into a utf-32 buffer through a tensor view of it, decode every kept character
+        # at once, then cut the text into rows
+        buffer = bytearray(codes.numel() * 4)
+        if codes.numel():
+            torch.frombuffer(buffer, dtype=torch.int32).copy_(codes)
+        text = buffer.decode(UTF32)
+        ends = torch.cumsum(keep.sum(dim=1), 0).tolist()
+        return [text[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+    def decode_int_from_float_batch(self, tensor: torch.Tensor, normalization_factor: float = 1.0) -> List[float]:
+        means = tensor.float().view(tensor.size(0), -1).mean(dim=-1)
+        return (torch.trunc(means) * normalization_factor).tolist()
+
+    def decode_float_batch(self, tensor: torch.Tensor, normalization_factor: float = 1.0) -> List[float]:
+        means = tensor.float().view(tensor.size(0), -1).mean(dim=-1)
+        return (means * normalization_factor).tolist()
+
+    def decode_boolean_from_float_batch(self, tensor: torch.Tensor) -> List[bool]:
+        # Encoded booleans are 0.0/1.0, so threshold the value itself
+        return (tensor.float().view(tensor.size(0), -1)[:, 0] >= 0.5).tolist()
+
+    def decode_category_batch(self, tensor: torch.Tensor, reverse_category_map: List[str]) -> List[str]:
+        return [reverse_category_map[idx] for idx in tensor.long().view(-1).tolist()]
+
+    def decode_date_components(self, tensor: torch.Tensor) -> torch.Tensor:
+        """ Inverse of the normalization in `encode_date_batch`. [N, 3] normalized -> [N, 3] year/month/day as integers. """
+        tensor = tensor.double().view(-1, 3)
+        year = torch.round(torch.sign(tensor[:, 0]) * torch.expm1(tensor[:, 0].abs()))
+        month = torch.round(tensor[:, 1] * 11 + 1).clamp(1, 12)
+        day = torch.round(tensor[:, 2] * 30 + 1).clamp(1, 31)
+        return torch.stack([year, month, day], dim=1).long()
+
+    def decode_date_batch(self, tensor: torch.Tensor) -> List[Dict[str, int]]:
+        return [{"year": y, "month": m, "day": d} for y, m, d in self.decode_date_components(tensor).tolist()]
+
     
     
     
@@ -1,4 +1,7 @@
 import re
+import functools
+import torch
+from typing import List
 
 def build_regex_from_pattern(pattern: str) -> str:
     """
@@ -29,12 +32,46 @@ def build_regex_from_pattern(pattern: str) -> str:
 
     return f"^{regex}$"
 
+MONTH_NAMES = {
+    name: i + 1 for i, names in enumerate(zip(
+        ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"],
+        ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"],
+    )) for name in names
+}
+
+@functools.lru_cache(maxsize=None)
+def compile_date_pattern(date_pattern: str, multiline: bool = False) -> re.Pattern:
+    """
+    Compiled regex for a date pattern, built once per pattern and reused.
+    `multiline` anchors every line instead of the whole string, see `parse_date_column`.
+    """
+    return re.compile(build_regex_from_pattern(date_pattern), re.MULTILINE if multiline else 0)
+
+def _month(value: str) -> int:
+    return MONTH_NAMES[value] if value in MONTH_NAMES else int(value)
+
 def get_year_date_month(val:str, date_pattern:str):
-    regex_pattern = build_regex_from_pattern(date_pattern)
-    match = re.match(regex_pattern, val)
+    match = compile_date_pattern(date_pattern).match(val)
     if not match:
         raise ValueError(f"Date string '{val}' does not match the date pattern '{date_pattern}'.")
     year = int(match.group('year'))
-    month = int(match.group('month'))
+    month = _month(match.group('month'))
     day = int(match.group('day'))
-    return {"year":year, "month":month, "day":day}
\ No newline at end of file
+    return {"year":year, "month":month, "day":day}
+
+def parse_date_column(values: List[str], date_pattern: str) -> torch.Tensor:
+    """
+    Parses a whole column of date strings into a [N, 3] long tensor of year, month, day.
+
+    The strings are joined into one text and scanned with a single multiline regex pass. If that
+    doesn't yield exactly one match per value, the column is parsed one value at a time so the
+    offending string is reported.
+    """
+    regex = compile_date_pattern(date_pattern, multiline=True)
+    matches = regex.findall("\n".join(values)) if values else []
+    if len(matches) != len(values) or any("\n" in value for value in values):
+        dates = [get_year_date_month(value, date_pattern) for value in values]
+        return torch.tensor([[date["year"], date["month"], date["day"]] for date in dates], dtype=torch.long).view(-1, 3)
+    # findall returns the groups in the order they appear in the pattern
+    year, month, day = (regex.groupindex[key] - 1 for key in ("year", "month", "day"))
+    return torch.tensor([(int(match[year]), _month(match[month]), int(match[day])) for match in matches], dtype=torch.long).view(-1, 3)
@@ -12,19 +12,21 @@ def stringdate(val, pattern):
     else:
         year_str = f"{year:04d}"
 
-    # Create a mapping from pattern to actual values
+    # Create a mapping from pattern to actual values, computed only for the placeholders the pattern uses
+    # (a generated day can be past the end of its month, there is no weekday for 02-31)
     replacements = {
-        "%Y": year_str,                      # Year with century as a decimal number
-        "%m": f"{month:02d}",                # Zero-padded month
-        "%d": f"{day:02d}",                  # Zero-padded day of the month
-        "%y": year_str[-2:],                 # Last two digits of the year
-        "%b": datetime.date(1900, month, 1).strftime('%b'),  # Abbreviated month name
-        "%B": datetime.date(1900, month, 1).strftime('%B'),  # Full month name
-        "%a": datetime.date(1900, month, day).strftime('%a'), # Abbreviated weekday name
-        "%A": datetime.date(1900, month, day).strftime('%A'), # Full weekday name
+        "%Y": lambda: year_str,                      # Year with century as a decimal number
+        "%m": lambda: f"{month:02d}",                # Zero-padded month
+        "%d": lambda: f"{day:02d}",                  # Zero-padded day of the month
+        "%y": lambda: year_str[-2:],                 # Last two digits of the year
+        "%b": lambda: datetime.date(1900, month, 1).strftime('%b'),  # Abbreviated month name
+        "%B": lambda: datetime.date(1900, month, 1).strftime('%B'),  # Full month name
+        "%a": lambda: datetime.date(1900, month, day).strftime('%a'), # Abbreviated weekday name
+        "%A": lambda: datetime.date(1900, month, day).strftime('%A'), # Full weekday name
     }
 
     # Replace the pattern placeholders with actual values
     for placeholder, value in replacements.items():
-        pattern = pattern.replace(placeholder, value)
+        if placeholder in pattern:
+            pattern = pattern.replace(placeholder, value())
     return pattern
\ No newline at end of file
@@ -0,0 +1,27 @@
+import torch
+from tbt.config.config import ModelConfig
+from tbt.model.model import DataTransformerModel
+from tbt.trainer.trainer import Trainer
+
+VALUES = [f"v{i}" for i in range(40)]
+
+
+def make_trainer():
+    config = ModelConfig()
+    config.float("grade", 2)
+    config.category("bucket", values=VALUES, head="adaptive")
+    torch.manual_seed(0)
+    model = DataTransformerModel(config, d_model=16, nhead=2, num_encoder_layers=1, num_decoder_layers=1, dim_feedforward=16, dropout=0.0, max_len=64)
+    # Mostly the frequent values, the tail clusters only show up in a few batches
+    records = [{"grade": (i % 7) / 4, "bucket": VALUES[39 if i == 60 else i % 2]} for i in range(64)]
+    trainer = Trainer(model, config)
+    trainer.add_data(records, records)
+    return trainer
+
+
+def test_distributed_training_with_adaptive_head():
+    trainer = make_trainer()
+    before = {key: tensor.clone() for key, tensor in trainer.model.state_dict().items()}
+    trainer.train_distributed(2, epochs=2, window_size=4, batch_size=2, shuffle=False)
+    assert trainer.epoch == 2
+    assert any(not torch.equal(before[key], tensor) for key, tensor in trainer.model.state_dict().items())
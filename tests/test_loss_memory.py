@@ -0,0 +1,83 @@
+import torch
+import pytest
+from tbt.config.config import ModelConfig
+from tbt.model.model import DataTransformerModel
+from tbt.trainer.trainer import Trainer
+from tbt.dataset.dataset import EncodedDataset
+
+SIZES = [256, 512, 1024, 2048]
+
+
+def make_config():
+    config = ModelConfig()
+    config.int("age", 50)
+    config.float("grade", 2)
+    config.boolean("valid")
+    config.category("bucket", values=["a", "b", "c"])
+    config.string("name", max_len=8, character_set=["a", "b", "c", "d"])
+    config.date("date", "%m-%d-%Y")
+    return config
+
+
+def make_model(config):
+    torch.manual_seed(0)
+    return DataTransformerModel(config, d_model=16, nhead=2, num_encoder_layers=1, num_decoder_layers=1, dim_feedforward=16, dropout=0.0, max_len=64)
+
+
+def make_records(n):
+    return [
+        {"age": i % 50, "grade": (i % 7) / 4, "valid": i % 2 == 0, "bucket": "abc"[i % 3], "name": "abcd"[i % 4] * (1 + i % 8), "date": f"0{1 + i % 9}-1{i % 10}-19{10 + i % 90}"}
+        for i in range(n)
+    ]
+
+
+def saved_bytes(fn):
+    """ Bytes of every tensor autograd keeps for the backward pass while running `fn`, and the largest one. """
+    sizes = []
+
+    def pack(tensor):
+        sizes.append(tensor.numel() * tensor.element_size())
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        fn()
+    return sum(sizes), max(sizes)
+
+
+def assert_linear(measurements):
+    """ Doubling N may at most about double memory, quadratic growth would quadruple it. """
+    for (n, size), (next_n, next_size) in zip(measurements, measurements[1:]):
+        assert next_size <= size * (next_n / n) * 1.25, f"memory grew from {size} bytes at N={n} to {next_size} bytes at N={next_n}"
+
+
+@pytest.mark.parametrize("key", ["age", "grade", "valid", "bucket", "name", "date"])
+def test_compute_loss_memory_is_linear(key):
+    config = make_config()
+    model = make_model(config)
+    trainer = Trainer(model, config)
+    layer = config.layers[key]
+    totals, largest = [], []
+    for n in SIZES:
+        dataset = EncodedDataset(make_records(n), make_records(n), model)
+        output = model.output_layers[key](torch.randn(1, n, 16)).detach().requires_grad_()
+        target = dataset.loss_target[key].unsqueeze(0)
+        total, peak = saved_bytes(lambda: trainer.compute_loss(output, target, layer.datatype, layer).backward())
+        totals.append((n, total))
+        largest.append((n, peak))
+    assert_linear(totals)
+    assert_linear(largest)
+
+
+def test_train_step_memory_is_linear():
+    config = make_config()
+    model = make_model(config)
+    trainer = Trainer(model, config)
+    optimizer = trainer.get_optimizer()
+    scaler = trainer.get_scaler()
+    totals = []
+    for n in SIZES:
+        dataset = EncodedDataset(make_records(n), make_records(n), model)
+        source, target, loss_targets = dataset.windows(32)
+        total, _ = saved_bytes(lambda: trainer.train_step(optimizer, scaler, source, target, loss_targets))
+        totals.append((n, total))
+    assert_linear(totals)